@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+core/alerts.py
+
+Правила floor-алертов по стакану и их доставка через alert_outbox. Один и
+тот же движок работает в двух режимах (alert_mode):
+
+- inline  — в процессе парсера: записи после сохранения передаются в
+  notify(), оценка и отправка идут в отдельной задаче, не задерживая
+  воркеры деталей;
+- polling — в notify_floor_alerts.py: стакан догоняется по offer_events
+  раз в notify_interval_seconds, затем вызывается run_once().
+
+Алерты одного чата отправляются сводкой — одним сообщением, важные первыми.
+В inline-режиме строки чата копятся до alert_digest_window секунд с
+постановки самой старой; Super не ждёт дольше alert_urgent_delay. В
+polling-режиме сводку образует всё, что поставлено за один проход.
+"""
+
+import asyncio
+import time
+from datetime import datetime, timedelta
+
+from core.offer import Offer, UNSET, format_ton
+from core.order_book import OrderBook
+from storage.connections import ConnectionManager
+from storage.db import get_offers_by_tokens
+from storage.writer import OfferWriter
+from storage.outbox import (
+    alert_key,
+    get_known_alert_keys,
+    enqueue_alert,
+    fetch_due_alerts,
+    complete_alerts,
+    drop_chat_alerts,
+    prune_outbox,
+)
+from utils.telegram import TelegramSender, ChatRegistry
+
+# Строк alert_outbox за один проход отправки
+OUTBOX_BATCH = 500
+# Лимит длины sendMessage
+MAX_MESSAGE_LEN = 4096
+# Порядок алертов в сводке: меньше — важнее
+ALERT_PRIORITY = {"super": 0, "half": 1, "trash": 2}
+
+def make_message(url: str, rec: dict, label: str) -> str:
+    lines = [f"{label}\n{url}"]
+    for k, v in rec.items():
+        lines.append(f"{k}: {v}")
+    return "\n".join(lines)
+
+class AlertEngine:
+    def __init__(self, cfg: dict, book: OrderBook, db: ConnectionManager,
+                 sender: TelegramSender, registry: ChatRegistry, logger, statistics=None,
+                 writer: OfferWriter = None):
+        self.cfg = cfg
+        self.book = book
+        self.db = db
+        # Запись в alert_outbox: в парсере — через OfferWriter (единственный
+        # писатель), без него — напрямую на соединении-писателе db
+        self.writer = writer
+        self.sender = sender
+        self.registry = registry
+        self.logger = logger
+        self.statistics = statistics
+        self.trash_count = cfg["trash_count"]
+        self.half_factor = cfg.get("half_factor", 0.98)
+        self.super_factor = cfg.get("super_factor", 0.96)
+        self.digest_window = timedelta(seconds=cfg.get("alert_digest_window", 3.0))
+        self.urgent_delay = timedelta(seconds=cfg.get("alert_urgent_delay", 0.0))
+        self._queue = asyncio.Queue()
+        self._task = None
+        self._last_prune = 0.0
+        # Через сколько секунд созреет ближайшая отложенная сводка (None — таких нет)
+        self._next_flush = None
+
+    def evaluate(self) -> list:
+        """
+        Алерты по текущему стакану: (token, тип, эффективная цена, заголовок).
+
+        Trash — каждый оффер топ-trash_count; Half/Super — floor дешевле
+        следующего оффера на 2%/4%. Повторы отсекаются ключом в alert_outbox.
+        """
+        top = self.book.head(self.trash_count)
+        second = self.book.kth(1)
+        alerts = []
+        for idx, (eff, token) in enumerate(top, start=1):
+            alerts.append((token, "trash", eff, f"🗑️ Trash Alert: new #{idx}"))
+            if idx == 1 and second is not None:
+                if eff <= second[0] * self.half_factor:
+                    alerts.append((token, "half", eff, "⚠️ Half Alert (−2%)"))
+                if eff <= second[0] * self.super_factor:
+                    alerts.append((token, "super", eff, "🔥 Super Alert (−4%)"))
+        return alerts
+
+    def is_relevant(self, token: str) -> bool:
+        """Может ли изменение токена повлиять на алерты: он в топе (с запасом на «второй»)."""
+        rank = self.book.rank(token)
+        return rank is not None and rank <= self.trash_count
+
+    def _fields(self, row, offer: Offer) -> dict:
+        if offer is not None:
+            def value(v):
+                return format_ton(v) if v is not UNSET else "—"
+            return {
+                "sale_price":     value(offer.sale_price),
+                "sale_fee":       value(offer.sale_fee),
+                "royalty_amount": value(offer.royalty_amount),
+                "fee_total":      value(offer.fee_total),
+                "created_at":     row[5] if row is not None else "—",
+            }
+        _, p, f, ramt, ftot, created = row
+        return {
+            "sale_price":       format_ton(p),
+            "sale_fee":         format_ton(f),
+            "royalty_amount":   format_ton(ramt),
+            "fee_total":        format_ton(ftot),
+            "created_at":       created
+        }
+
+    async def enqueue(self, offers: dict = None) -> int:
+        """
+        Ставит в alert_outbox новые алерты текущего стакана.
+
+        Args:
+            offers: token -> Offer из парсера; для остальных токенов данные читаются из БД
+
+        Returns:
+            int: Количество новых алертов
+        """
+        offers = offers or {}
+        alerts = self.evaluate()
+        async with self.db.read() as conn:
+            known = await get_known_alert_keys(conn, [alert_key(*a[:3]) for a in alerts])
+            alerts = [a for a in alerts if alert_key(*a[:3]) not in known]
+            # Полные данные оффера читаются только для новых алертов
+            rows = await get_offers_by_tokens(conn, list({a[0] for a in alerts}))
+        queue = []
+        for token, alert_type, eff, label in alerts:
+            row, offer = rows.get(token), offers.get(token)
+            if row is None and offer is None:
+                continue
+            url = (
+                f"https://getgems.io/collection/"
+                f"{self.cfg['collection_address']}/{token}?modalId=sale_info"
+            )
+            queue.append((token, alert_type, eff, make_message(url, self._fields(row, offer), label),
+                          ALERT_PRIORITY[alert_type]))
+        if queue:
+            await self._write(self._enqueue_alerts, list(self.registry.chats), queue)
+        return len(queue)
+
+    @staticmethod
+    async def _enqueue_alerts(conn, chats: list, queue: list):
+        for token, alert_type, eff, text, priority in queue:
+            await enqueue_alert(conn, chats, token, alert_type, eff, text, priority)
+
+    async def _write(self, fn, *args):
+        """fn(conn, *args) на соединении-писателе: через OfferWriter, если он есть."""
+        if self.writer is not None:
+            return await self.writer.execute(fn, *args)
+        return await fn(self.db.writer, *args)
+
+    def _ready_at(self, rows: list) -> datetime:
+        """Когда сводку чата пора отправить: окно от самой старой строки, для Super — urgent_delay."""
+        created = [datetime.fromisoformat(r[5]) for r in rows]
+        ready = min(created) + self.digest_window
+        urgent = [c for c, r in zip(created, rows) if r[4] == ALERT_PRIORITY["super"]]
+        if urgent:
+            ready = min(ready, min(urgent) + self.urgent_delay)
+        return ready
+
+    @staticmethod
+    def _digests(rows: list) -> list:
+        """
+        Строки одного чата -> сводки в пределах MAX_MESSAGE_LEN, важные первыми.
+
+        Returns:
+            list: Пары (текст, строки outbox в нём)
+        """
+        rows = sorted(rows, key=lambda r: (r[4], r[0]))
+        chunks, current, size = [], [], 0
+        for row in rows:
+            # Запас на заголовок сводки и разделитель
+            extra = len(row[2]) + 2
+            if current and size + extra > MAX_MESSAGE_LEN - 32:
+                chunks.append(current)
+                current, size = [], 0
+            current.append(row)
+            size += extra
+        if current:
+            chunks.append(current)
+        digests = []
+        for chunk in chunks:
+            if len(chunk) == 1:
+                text = chunk[0][2]
+            else:
+                text = f"🔔 {len(chunk)} alerts\n\n" + "\n\n".join(r[2] for r in chunk)
+            digests.append((text[:MAX_MESSAGE_LEN], chunk))
+        return digests
+
+    async def deliver(self, flush: bool = False) -> int:
+        """
+        Отправка созревших строк alert_outbox: одна сводка на чат.
+
+        Args:
+            flush: Не ждать окна сводки (все строки, которым пора, уходят сразу)
+
+        Returns:
+            int: Отправлено алертов
+        """
+        async with self.db.read() as conn:
+            due = await fetch_due_alerts(conn, OUTBOX_BATCH)
+        self._next_flush = None
+        if not due:
+            return 0
+        by_chat = {}
+        for row in due:
+            by_chat.setdefault(row[1], []).append(row)
+        now = datetime.utcnow()
+        messages, batches, held = [], [], []
+        for chat_id, rows in by_chat.items():
+            ready = self._ready_at(rows)
+            if not flush and ready > now:
+                held.append((ready - now).total_seconds())
+                continue
+            for text, chunk in self._digests(rows):
+                messages.append((chat_id, text))
+                batches.append(chunk)
+        if held:
+            self._next_flush = min(held)
+        if not messages:
+            return 0
+        report = await self.sender.send_many(messages)
+        sent, failed = [], []
+        # Сводка отправляется или повторяется целиком
+        for chunk, result in zip(batches, report["results"]):
+            if result == "ok":
+                sent.extend(r[0] for r in chunk)
+            elif result == "failed":
+                failed.extend((r[0], r[3], "send failed") for r in chunk)
+        await self._write(complete_alerts, sent, failed,
+                          self.cfg["outbox_retry_base"], self.cfg["outbox_max_attempts"])
+        if report["blocked"]:
+            self.registry.remove(report["blocked"])
+            await self._write(drop_chat_alerts, report["blocked"])
+            self.logger.info(f"Removed {len(report['blocked'])} blocked chats")
+        if len(sent) > len(messages):
+            self.logger.info(f"Coalesced {len(sent)} alerts into {len(messages)} messages")
+        return len(sent)
+
+    async def broadcast(self, text: str):
+        """Служебное сообщение всем чатам в обход очереди."""
+        if not self.registry.chats:
+            return
+        report = await self.sender.send_all(set(self.registry.chats), text)
+        if report["blocked"]:
+            self.registry.remove(report["blocked"])
+
+    async def run_once(self, offers: dict = None, flush: bool = False) -> tuple:
+        """
+        Постановка новых алертов, отправка очереди и, раз в час, её очистка.
+
+        Args:
+            offers: См. enqueue
+            flush: См. deliver
+
+        Returns:
+            tuple: (новых алертов, отправлено алертов)
+        """
+        queued = await self.enqueue(offers)
+        sent = await self.deliver(flush)
+        now = time.monotonic()
+        if now - self._last_prune >= 3600:
+            self._last_prune = now
+            await self._write(prune_outbox, self.cfg["outbox_ttl_hours"])
+        return queued, sent
+
+    # --- inline-режим ---
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    def notify(self, rec: Offer, seen_at: float):
+        """Запись сохранена и применена к стакану; seen_at — когда её увидели в листинге."""
+        self._queue.put_nowait((rec, seen_at))
+
+    async def _run(self):
+        # Повторы отправки ждут своего next_attempt_at и без новых записей;
+        # отложенная сводка — своего окна
+        retry_every = self.cfg["outbox_retry_base"]
+        # Когда увидели самую раннюю запись, чьи алерты ещё ждут сводки
+        pending_seen = None
+        while True:
+            timeout = retry_every
+            if self._next_flush is not None:
+                timeout = min(timeout, self._next_flush)
+            try:
+                item = await asyncio.wait_for(self._queue.get(), timeout)
+            except asyncio.TimeoutError:
+                item = None
+            offers, first_seen = {}, None
+            # Всё накопившееся за время прошлой отправки — одним проходом
+            while item is not None:
+                rec, seen_at = item
+                offers[rec.token_address] = rec
+                first_seen = seen_at if first_seen is None else min(first_seen, seen_at)
+                item = self._queue.get_nowait() if not self._queue.empty() else None
+            try:
+                queued, sent = await self.run_once(offers)
+            except Exception as e:
+                if self.statistics is not None:
+                    self.statistics.add_error()
+                self.logger.error(f"Alert stage failed: {e}")
+                continue
+            # Задержка — только для записей, которые дали новые алерты; сводка
+            # может уйти и в одном из следующих проходов
+            if queued and first_seen is not None:
+                pending_seen = first_seen if pending_seen is None else min(pending_seen, first_seen)
+            if sent and pending_seen is not None:
+                latency = time.perf_counter() - pending_seen
+                pending_seen = None
+                if self.statistics is not None:
+                    self.statistics.add_stage_time("alert_latency", latency)
+                self.logger.info(f"Alerts: {sent} sent, {latency:.2f}s after listing seen")
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
@@ -14,23 +14,27 @@ import signal
 import random
 import contextlib
 import time
-from datetime import datetime
+from pathlib import Path
 
 from utils.config import load_config
 from utils.logging_cfg import setup_logger
 from utils.statistics import Statistics
 from utils.async_session import AsyncSession
-from storage.db import (
-    get_connection,
-    init_tables,
-    upsert_offer,
-    close_connection,
-)
-from bs4 import BeautifulSoup
+from utils.adaptive_limiter import AdaptiveLimiter
+from utils.telegram import TelegramSender, ChatRegistry, UpdatePoller
+from core.alerts import AlertEngine
+from core.detail_cache import DetailCache, list_fingerprint
+from core.graphql_details import GraphQLDetailLoader, persisted_query_url
+from core.detail_parser import DetailParsePool
+from core.next_data import read_until_next_data
+from core.offer import Offer, nano, format_ton
+from core.order_book import OrderBook
+from storage.connections import open_connections
+from storage.writer import OfferWriter
 import json
-import urllib.parse
+import aiohttp
 
-def build_graphql_url(cfg: dict) -> str:
+def build_graphql_url(cfg: dict, cursor: str = None) -> str:
     query = json.dumps({
         "$and": [
             {"collectionAddress": cfg["collection_address"]},
@@ -42,97 +46,149 @@ def build_graphql_url(cfg: dict) -> str:
         {"index":    {"order": "asc"}}
     ], separators=(",", ":"))
     variables = {"query": query, "attributes": None, "sort": sort, "count": cfg["count"]}
-    extensions = {"persistedQuery": {"version": 1, "sha256Hash": cfg["sha256_hash"]}}
-    ve = urllib.parse.quote(json.dumps(variables, separators=(",", ":")))
-    ee = urllib.parse.quote(json.dumps(extensions, separators=(",", ":")))
-    return f"{cfg['graphql_url']}?operationName=nftSearch&variables={ve}&extensions={ee}"
+    if cursor:
+        # Курсор следующей страницы из alphaNftItemSearch.cursor
+        variables["cursor"] = cursor
+    return persisted_query_url(cfg["graphql_url"], "nftSearch", variables, cfg["sha256_hash"])
 
-def parse_list_data(node: dict) -> dict:
+def parse_list_data(node: dict) -> Offer:
+    """Узел листинга -> Offer с ценами в нанотонах (updated_at/created_at ставит БД)."""
     sale      = node.get("sale")     or {}
     max_offer = node.get("maxOffer") or {}
     stats     = node.get("stats")    or {}
-    now = datetime.utcnow().isoformat()
-    return {
-        "token_address":     node.get("address"),
-        "phone_number":      node.get("name"),
-        "sale_contract":     sale.get("address"),
-        "sale_price":        float(sale.get("fullPrice", 0))  / 1e9 if sale.get("fullPrice") else None,
-        "sale_fee":          float(sale.get("networkFee", 0)) / 1e9 if sale.get("networkFee") else None,
-        "max_offer_price":   float(max_offer.get("profitPrice", 0)) / 1e9 if max_offer.get("profitPrice") else None,
-        "prev_owners_count": stats.get("prevOwnersCount"),
-        "owner_address":     node.get("ownerAddress") or "",
-        "updated_at":        now,
-        "created_at":        now,
-    }
+    return Offer(
+        node.get("address"),
+        phone_number=node.get("name"),
+        sale_contract=sale.get("address"),
+        sale_price=nano(sale.get("fullPrice")),
+        sale_fee=nano(sale.get("networkFee")),
+        max_offer_price=nano(max_offer.get("profitPrice")),
+        prev_owners_count=stats.get("prevOwnersCount"),
+        owner_address=node.get("ownerAddress") or "",
+    )
 
-async def fetch_offers_list(cfg: dict, session: AsyncSession, logger) -> list:
-    url = build_graphql_url(cfg)
-    headers = {
+def _list_headers(cfg: dict) -> dict:
+    return {
         "Accept":       "*/*",
         "Content-Type": "application/json",
         "x-gg-client":  cfg["x_gg_client"]
     }
+
+async def _fetch_list_page(cfg: dict, session: AsyncSession, logger, cursor: str = None) -> tuple:
+    """
+    Одна страница nftSearch. Возвращает (edges, cursor следующей страницы или None).
+    Исключения пробрасываются вызывающему.
+    """
+    url = build_graphql_url(cfg, cursor)
+    start = time.perf_counter()
+    resp = await session.get(url, headers=_list_headers(cfg))
+    data = await resp.json()
+    search = (data.get("data") or {}).get("alphaNftItemSearch") or {}
+    edges = search.get("edges") or []
+    elapsed = time.perf_counter() - start
+    logger.info(f"_fetch_list_page: page with {len(edges)} edges in {elapsed:.2f}s")
+    return edges, search.get("cursor")
+
+async def iter_offers_pages(cfg: dict, session: AsyncSession, logger, status: dict = None):
+    """
+    Асинхронный генератор страниц листинга по курсору alphaNftItemSearch.
+
+    Курсор следующей страницы известен только из ответа на текущую, поэтому
+    страницы запрашиваются конвейером: пока вызывающий обрабатывает страницу N,
+    запрос страницы N+1 уже в полёте. Каждая страница отдаётся сразу по приходу.
+    Без list_paginate отдаётся одна страница (прежнее поведение).
+
+    В status["complete"] выставляется True, если листинг прочитан до конца
+    (курсор закончился), а не оборван ошибкой или лимитом страниц.
+    """
+    status = status if status is not None else {}
+    status["complete"] = False
+    max_pages = cfg["list_max_pages"] if cfg["list_paginate"] else 1
     start = time.perf_counter()
+    pages = 0
+    total = 0
+    pending = asyncio.create_task(_fetch_list_page(cfg, session, logger))
     try:
-        resp = await session.get(url, headers=headers)
-        data = await resp.json()
-        edges = data.get("data", {}).get("alphaNftItemSearch", {}).get("edges", [])
-        elapsed = time.perf_counter() - start
-        logger.info(f"fetch_offers_list: retrieved {len(edges)} edges in {elapsed:.2f}s")
-        return edges
-    except Exception as e:
+        while pending is not None:
+            try:
+                edges, cursor = await pending
+            except Exception as e:
+                logger.warning(f"iter_offers_pages: page #{pages + 1} error: {e}")
+                return
+            pages += 1
+            total += len(edges)
+            pending = None
+            if not edges or not cursor:
+                status["complete"] = True
+            if edges and cursor and (not max_pages or pages < max_pages):
+                pending = asyncio.create_task(_fetch_list_page(cfg, session, logger, cursor))
+            if edges:
+                yield edges
+    finally:
+        if pending is not None:
+            pending.cancel()
+            with contextlib.suppress(BaseException):
+                await pending
         elapsed = time.perf_counter() - start
-        logger.warning(f"fetch_offers_list error after {elapsed:.2f}s: {e}")
-        return []
+        logger.info(f"iter_offers_pages: {pages} pages, {total} edges in {elapsed:.2f}s")
 
-async def fetch_offer_details(cfg: dict, session: AsyncSession, token: str, logger) -> dict:
+async def fetch_offer_details(cfg: dict, session: AsyncSession, token: str, logger,
+                              parse_pool: DetailParsePool, limiter: AdaptiveLimiter = None) -> dict:
     url = f"https://getgems.io/collection/{cfg['collection_address']}/{token}?modalId=sale_info"
-    await asyncio.sleep(random.uniform(cfg["request_delay_min"], cfg["request_delay_max"]))
     start = time.perf_counter()
+    timing = {}
     try:
-        resp = await session.get(url)
+        resp = await session.get(url, timing=timing)
         if resp.status != 200:
             elapsed = time.perf_counter() - start
             logger.warning(f"fetch_offer_details {token} status {resp.status} in {elapsed:.2f}s")
+            if limiter is not None and (resp.status in (403, 429) or resp.status >= 500):
+                limiter.on_overload()
+            return {}
+        if limiter is not None:
+            # Задержка до ответа сервера: без ожидания токен-бакета хоста,
+            # чтения и разбора тела
+            limiter.on_success(time.perf_counter() - timing["start"])
+        raw = await read_until_next_data(resp)
+        details, wait, parse_time = await parse_pool.parse(raw)
+        elapsed = time.perf_counter() - start
+        if details is None:
+            logger.warning(f"_parse_details: no data for {token} after {elapsed:.2f}s")
             return {}
-        text = await resp.text()
-        details = await asyncio.to_thread(_parse_details, text, logger, start, token)
+        logger.info(f"_parse_details for {token} in {elapsed:.2f}s "
+                    f"(queue {wait * 1000:.1f}ms, parse {parse_time * 1000:.1f}ms)")
         return details
     except Exception as e:
         elapsed = time.perf_counter() - start
         logger.warning(f"fetch_offer_details error for {token} after {elapsed:.2f}s: {e}")
+        if limiter is not None and isinstance(e, (asyncio.TimeoutError, aiohttp.ClientError)):
+            limiter.on_overload()
         return {}
 
-def _parse_details(html: str, logger, start: float, token: str) -> dict:
-    soup = BeautifulSoup(html, "html.parser")
-    script = soup.find("script", id="__NEXT_DATA__")
-    if not script or not script.string:
-        elapsed = time.perf_counter() - start
-        logger.warning(f"_parse_details: no data for {token} after {elapsed:.2f}s")
-        return {}
-    gql = json.loads(script.string)
-    cache = gql.get("props", {}).get("pageProps", {}).get("gqlCache", {})
-    details = {}
-    for k, v in cache.items():
-        if k.startswith("NftSale"):
-            details.update({
-                "royalties_address": v.get("royaltyAddress"),
-                "royalty_amount":    float(v.get("royaltyAmount", 0))  / 1e9 if v.get("royaltyAmount") else None,
-                "fee_total":         float(v.get("marketplaceFee", 0)) / 1e9 if v.get("marketplaceFee") else None,
-                "sale_type":         v.get("__typename"),
-            })
-        if k.startswith("NftItem") and "nft_address" not in details:
-            details["nft_address"] = v.get("address")
-    elapsed = time.perf_counter() - start
-    logger.info(f"_parse_details for {token} in {elapsed:.2f}s")
-    return details
-
 class AsyncStreamParser:
     def __init__(self, cfg):
         self.cfg = cfg
         self.logger = setup_logger("async_stream_parser", cfg["log_level"])
         self.statistics = Statistics()
         self.cycle_count = 0
+        self.detail_cache = DetailCache(cfg["detail_cache_ttl"], cfg["detail_cache_size"])
+        self.detail_loader = None
+        self.parse_pool = None
+        self.limiter = None
+        self._prev_ranks = {}
+        self._processed = 0
+        self.db = None
+        self.writer = None
+        self.order_book = OrderBook()
+        # alert_mode == "inline": движок алертов и его фоновые задачи
+        self.alerts = None
+        self._poll_task = None
+        self._last_history_maintenance = time.monotonic()
+        if cfg["adaptive_concurrency"]:
+            self.limiter = AdaptiveLimiter(
+                cfg["threads"], cfg["concurrency_min"], cfg["concurrency_max"],
+                statistics=self.statistics,
+            )
         self.running = True
         for sig in (signal.SIGINT, signal.SIGTERM):
             signal.signal(sig, self._signal_handler)
@@ -146,38 +202,118 @@ class AsyncStreamParser:
         rnd = self.cfg.get("cycle_randomization", 0.0)
         return base + random.uniform(0, base * rnd)
 
+    def _detail_priority(self, ld: Offer, rank: int) -> tuple:
+        """
+        Ключ очереди деталей: сначала топ trash_count листинга, внутри — офферы,
+        сменившие позицию с прошлого цикла, затем по эффективной цене.
+        """
+        eff = ld.effective_price
+        eff = eff if eff is not None else float("inf")
+        moved = self._prev_ranks.get(ld.token_address) != rank
+        return (0 if rank < self.cfg["trash_count"] else 1, 0 if moved else 1, eff)
+
     async def run_cycle(self, session: AsyncSession) -> int:
         logger = self.logger
-        edges = await fetch_offers_list(self.cfg, session, logger)
-        if not edges:
-            return 0
-
-        conn = await get_connection()
-        await init_tables(conn)
+        sem = self.limiter or asyncio.Semaphore(self.cfg["threads"])
+        queue = asyncio.PriorityQueue()
+        workers = []
+        ranks = {}
+        listing = {}
+        # Самая высокая sale_price прочитанных страниц: листинг отсортирован по
+        # цене, так что всё дешевле неё, чего в листинге нет, снято с продажи
+        max_price = None
+        self._processed = 0
+        try:
+            # Детали запрашиваются по мере прихода страниц, не дожидаясь всего листинга
+            async for edges in iter_offers_pages(self.cfg, session, logger, listing):
+                seen_at = time.perf_counter()
+                if not workers:
+                    # Параллельность HTML ограничивает sem; воркеров — по её максимуму,
+                    # а с GraphQL — на две пачки: одна собирается, пока другая в полёте
+                    n_workers = self.limiter.max_limit if self.limiter else self.cfg["threads"]
+                    if self.detail_loader is not None:
+                        n_workers = max(n_workers, 2 * self.cfg["detail_batch_size"])
+                    workers = [
+                        asyncio.create_task(self._detail_worker(queue, session, sem, logger))
+                        for _ in range(n_workers)
+                    ]
+                for edge in edges:
+                    ld = parse_list_data(edge.get("node", {}))
+                    rank = len(ranks)
+                    prio = self._detail_priority(ld, rank)
+                    ranks[ld.token_address] = rank
+                    if ld.sale_price is not None and (max_price is None or ld.sale_price > max_price):
+                        max_price = ld.sale_price
+                    queue.put_nowait((prio, rank, ld, seen_at))
+            if not workers:
+                return 0
+            await queue.join()
+            # Листинг прочитан целиком — сняты все неувиденные; оборван (count,
+            # list_max_pages, ошибка) — только неувиденные дешевле max_price
+            if not listing["complete"]:
+                logger.info(f"Listing truncated: delisting unseen offers below {format_ton(max_price)} TON only")
+            db_stats = await self.writer.end_cycle(ranks.keys(), listing["complete"], max_price)
+            if listing["complete"]:
+                self.order_book.retain(ranks.keys())
+            else:
+                for token in db_stats["delisted_tokens"]:
+                    self.order_book.remove(token)
+        finally:
+            for w in workers:
+                w.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+        self._prev_ranks = ranks
+        hits, misses = self.detail_cache.reset_counters()
+        logger.info(f"Detail cache: {hits} hits, {misses} misses, {len(self.detail_cache)} cached")
+        wal_kb = f"{db_stats['wal_bytes'] / 1024:.1f}KB" if db_stats["wal_bytes"] is not None else "n/a"
+        logger.info(f"DB: {db_stats['changed']} rows changed, {db_stats['delisted']} delisted, "
+                    f"WAL {wal_kb} this cycle")
+        floor = self.order_book.floor()
+        logger.info(f"Order book: {len(self.order_book)} offers, floor "
+                    f"{f'{format_ton(floor[0])} TON ({floor[1]})' if floor else 'n/a'}")
+        return self._processed
 
-        sem = asyncio.Semaphore(self.cfg["threads"])
-        tasks = []
-        for edge in edges:
-            node = edge.get("node", {})
-            tasks.append(asyncio.create_task(self._process_node(node, session, sem, logger, conn)))
-
-        processed = 0
-        for coro in asyncio.as_completed(tasks):
+    async def _detail_worker(self, queue, session, sem, logger):
+        while True:
+            prio, rank, ld, seen_at = await queue.get()
             try:
-                await coro
-                processed += 1
+                await self._process_node(ld, session, sem, logger, urgent=prio[0] == 0, seen_at=seen_at)
+                self._processed += 1
+                if prio[0] == 0 and prio[1] == 0:
+                    # Новый/сдвинувшийся оффер в топе: от появления в листинге до записи
+                    self.statistics.add_stage_time("top_offer_persist", time.perf_counter() - seen_at)
             except Exception:
                 pass
-        await close_connection(conn)
-        return processed
+            finally:
+                queue.task_done()
 
-    async def _process_node(self, node, session, sem, logger, conn):
+    async def _process_node(self, ld, session, sem, logger, urgent: bool = False, seen_at: float = None):
+        token = ld.token_address
+        fp = list_fingerprint(ld)
+        details = self.detail_cache.get(token, fp)
+        if details is None:
+            details = await self._fetch_details(session, token, sem, logger)
+            if details:
+                self.detail_cache.put(token, fp, details)
+        rec = ld.with_details(details)
+        # Запись — через очередь писателя, вне слота sem: сетевые задачи не ждут SQLite
+        await self.writer.put(rec, urgent)
+        was_top = self.alerts is not None and self.alerts.is_relevant(token)
+        if self.order_book.update(rec) and self.alerts is not None:
+            # Оценка алертов — сразу после сохранения, если запись задела топ стакана
+            if was_top or self.alerts.is_relevant(token):
+                self.alerts.notify(rec, seen_at if seen_at is not None else time.perf_counter())
+
+    async def _fetch_details(self, session, token, sem, logger) -> dict:
+        if self.detail_loader is not None:
+            # Ожидание пачки не занимает слот sem: иначе в пачку попадает не
+            # больше threads токенов
+            details = await self.detail_loader.load(token)
+            if details is not None:
+                return details
+            # GraphQL не вернул токен — фоллбек на HTML-страницу
         async with sem:
-            ld = parse_list_data(node)
-            details = await fetch_offer_details(self.cfg, session, node.get("address"), logger)
-            rec = {**ld, **details}
-            await upsert_offer(conn, rec)
-            logger.info(f"Upserted {rec.get('token_address')}")
+            return await fetch_offer_details(self.cfg, session, token, logger, self.parse_pool, self.limiter)
 
     async def print_stats(self):
         stats = self.statistics.get_stats()
@@ -186,11 +322,28 @@ class AsyncStreamParser:
         self.logger.info(f"Offers total: {stats['total_offers_processed']}")
         self.logger.info(f"Errors: {stats['total_errors']}")
         self.logger.info(f"Avg cycle time: {stats['avg_cycle_time']:.2f}s")
+        if stats["concurrency_limit"] is not None:
+            self.logger.info(f"Concurrency limit: {stats['concurrency_limit']}")
+        for stage, (count, avg, max_time) in stats["stages"].items():
+            self.logger.info(f"Stage {stage}: n={count} avg={avg * 1000:.1f}ms max={max_time * 1000:.1f}ms")
         self.logger.info("==================")
 
     async def run(self):
         self.logger.info("Starting async parser")
         session = AsyncSession()
+        self.parse_pool = DetailParsePool(self.cfg["parse_workers"], self.statistics)
+        self.db = await open_connections(self.cfg)
+        self.writer = OfferWriter(
+            self.db.writer, self.cfg["db_batch_size"], self.cfg["db_flush_interval"],
+            self.cfg["db_queue_size"], self.logger, self.statistics,
+            self.cfg["wal_checkpoint_interval"], self.cfg["wal_truncate_pages"],
+        )
+        await self.writer.start()
+        await self._load_order_book()
+        if self.cfg["alert_mode"] == "inline":
+            await self._start_alerts(session)
+        if self.cfg["detail_backend"] == "graphql":
+            self.detail_loader = GraphQLDetailLoader(self.cfg, session, self.logger)
 
         # Запуск периодического будильника для корректного Ctrl+C
         asyncio.create_task(self._wakeup())
@@ -210,11 +363,67 @@ class AsyncStreamParser:
                 self.logger.error(f"Error in cycle: {e}")
             if self.statistics.should_print_stats(self.cfg["stats_interval"]):
                 await self.print_stats()
+            await self._maybe_run_maintenance()
             await asyncio.sleep(self._calculate_cycle_delay())
 
+        await self._stop_alerts()
+        if self.detail_loader is not None:
+            await self.detail_loader.close()
         await session.close()
+        await self.writer.close()
+        await self.db.close()
+        self.parse_pool.close()
         self.logger.info("Async parser shutdown complete")
 
+    async def _load_order_book(self):
+        """Тёплый старт стакана из nft_offers (таблицы уже созданы писателем)."""
+        async with self.db.read() as conn:
+            n = await self.order_book.load(conn)
+        self.logger.info(f"Order book warm start: {n} active offers")
+
+    async def _start_alerts(self, session: AsyncSession):
+        """
+        Inline-алерты: движок и long polling чатов. alert_outbox пишется
+        через OfferWriter, как и nft_offers.
+        """
+        registry = ChatRegistry(Path(self.cfg["chats_file"]))
+        sender = TelegramSender(
+            session, self.cfg["bot_token"], self.logger,
+            concurrency=self.cfg["telegram_concurrency"],
+            chat_rps=self.cfg["telegram_chat_rps"],
+            max_retries=self.cfg["telegram_max_retries"],
+        )
+        poller = UpdatePoller(session, self.cfg["bot_token"], registry, self.logger,
+                              self.cfg["telegram_poll_timeout"])
+        self._poll_task = asyncio.create_task(poller.run())
+        self.alerts = AlertEngine(self.cfg, self.order_book, self.db, sender, registry,
+                                  self.logger, self.statistics, writer=self.writer)
+        self.alerts.start()
+        self.logger.info(f"Inline alerts enabled, known chats: {len(registry.chats)}")
+
+    async def _stop_alerts(self):
+        if self.alerts is not None:
+            await self.alerts.close()
+            self.alerts = None
+        if self._poll_task is not None:
+            self._poll_task.cancel()
+            await asyncio.gather(self._poll_task, return_exceptions=True)
+            self._poll_task = None
+
+    async def _maybe_run_maintenance(self):
+        """
+        Обслуживание БД раз в history_maintenance_interval: свёртка истории цен
+        и очистка подтверждённых событий.
+        """
+        now = time.monotonic()
+        if now - self._last_history_maintenance < self.cfg["history_maintenance_interval"]:
+            return
+        self._last_history_maintenance = now
+        await self.writer.maintain(
+            self.cfg["history_raw_days"], self.cfg["history_hourly_days"], self.cfg["history_daily_days"],
+            self.cfg["events_max_age_days"],
+        )
+
     async def _wakeup(self):
         while True:
             await asyncio.sleep(1)
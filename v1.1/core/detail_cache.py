@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+core/detail_cache.py
+
+Кэш результатов _parse_details по токенам. Роялти, комиссия и тип продажи
+меняются только вместе с контрактом продажи, поэтому страница деталей не
+запрашивается повторно, пока отпечаток полей листинга не изменился.
+"""
+
+import time
+from collections import OrderedDict
+
+# Поля parse_list_data, от которых зависят детали продажи
+FINGERPRINT_FIELDS = ("sale_contract", "sale_price", "sale_fee", "owner_address")
+
+def list_fingerprint(ld) -> tuple:
+    return tuple(getattr(ld, f) for f in FINGERPRINT_FIELDS)
+
+class DetailCache:
+    def __init__(self, ttl: float, max_size: int):
+        self.ttl = ttl
+        self.max_size = max_size
+        # token -> (fingerprint, details, expires_at); порядок = LRU
+        self._items = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, token: str, fingerprint: tuple):
+        item = self._items.get(token)
+        if item is None:
+            self.misses += 1
+            return None
+        fp, details, expires_at = item
+        if fp != fingerprint or expires_at < time.monotonic():
+            del self._items[token]
+            self.misses += 1
+            return None
+        self._items.move_to_end(token)
+        self.hits += 1
+        return dict(details)
+
+    def put(self, token: str, fingerprint: tuple, details: dict):
+        if self.max_size <= 0 or not token:
+            return
+        self._items[token] = (fingerprint, dict(details), time.monotonic() + self.ttl)
+        self._items.move_to_end(token)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+    def reset_counters(self) -> tuple:
+        hits, misses = self.hits, self.misses
+        self.hits = self.misses = 0
+        return hits, misses
+
+    def __len__(self):
+        return len(self._items)
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+core/detail_parser.py
+
+Разбор страницы деталей токена в словарь деталей продажи и стадия разбора:
+в потоке (asyncio.to_thread) или в пуле процессов, чтобы CPU-работа не
+конкурировала с event loop за GIL. Модуль не имеет побочных эффектов при
+импорте — его загружают процессы пула.
+"""
+
+import asyncio
+import json
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from bs4 import BeautifulSoup
+
+from core.graphql_details import details_from_gql_sale
+from core.next_data import extract_next_data, select_gql_cache
+
+def extract_gql_cache(html):
+    """
+    gqlCache из __NEXT_DATA__. Быстрый путь: поиск тега по байтам и выборочный
+    разбор только нужных записей кэша; далее полный json.loads; последний
+    фоллбек — разбор страницы через BeautifulSoup.
+    """
+    payload = extract_next_data(html)
+    gql = None
+    if payload is not None:
+        cache = select_gql_cache(payload)
+        if cache is not None:
+            return cache
+        try:
+            gql = json.loads(payload)
+        except ValueError:
+            pass
+    if gql is None:
+        soup = BeautifulSoup(html, "html.parser")
+        script = soup.find("script", id="__NEXT_DATA__")
+        if not script or not script.string:
+            return None
+        gql = json.loads(script.string)
+    return gql.get("props", {}).get("pageProps", {}).get("gqlCache", {})
+
+def details_from_gql_cache(cache: dict) -> dict:
+    details = {}
+    for k, v in cache.items():
+        if k.startswith("NftSale"):
+            details.update(details_from_gql_sale(v))
+        if k.startswith("NftItem") and "nft_address" not in details:
+            details["nft_address"] = v.get("address")
+    return details
+
+def parse_details(raw) -> tuple:
+    """
+    (details или None, время разбора). None — на странице нет __NEXT_DATA__.
+    Выполняется в процессе пула, поэтому без логгера и прочего состояния.
+    """
+    start = time.perf_counter()
+    cache = extract_gql_cache(raw)
+    details = details_from_gql_cache(cache) if cache is not None else None
+    return details, time.perf_counter() - start
+
+class DetailParsePool:
+    """
+    Стадия разбора деталей. При workers > 0 — пул процессов, иначе поток по
+    умолчанию. Время ожидания в очереди и время разбора учитываются отдельно.
+    """
+
+    def __init__(self, workers: int, statistics=None):
+        self.statistics = statistics
+        self._executor = None
+        if workers > 0:
+            # spawn: форк процесса с потоками aiosqlite/aiohttp небезопасен
+            self._executor = ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+            )
+
+    async def parse(self, raw) -> tuple:
+        """(details или None, ожидание в очереди, время разбора)."""
+        submitted = time.perf_counter()
+        if self._executor is not None:
+            loop = asyncio.get_running_loop()
+            details, parse_time = await loop.run_in_executor(self._executor, parse_details, raw)
+        else:
+            details, parse_time = await asyncio.to_thread(parse_details, raw)
+        wait = max(0.0, time.perf_counter() - submitted - parse_time)
+        if self.statistics is not None:
+            self.statistics.add_stage_time("parse_wait", wait)
+            self.statistics.add_stage_time("parse", parse_time)
+        return details, wait, parse_time
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+core/graphql_details.py
+
+Детали продажи через GraphQL вместо HTML-страницы токена. Запросы отдельных
+задач собираются в пачки (по образцу DataLoader): один запрос с алиасами
+nftItemByAddress на много токенов. Запрос отправляется как persisted query
+(GET с sha256Hash, как nftSearch); если сервер хэша не знает — текст
+регистрируется одним POST. Результат имеет ту же форму, что и _parse_details.
+Если сервер раз за разом отвечает без данных (запрос не принят схемой,
+не-JSON ответ, ошибка запроса), бэкенд отключается и все токены идут через HTML.
+"""
+
+import asyncio
+import hashlib
+import json
+import time
+import urllib.parse
+
+from core.offer import nano
+
+# Подряд идущих пачек без данных (ошибки GraphQL, не-JSON ответ, сбой запроса),
+# после которых бэкенд отключается
+MAX_SCHEMA_ERRORS = 3
+
+def persisted_query_url(graphql_url: str, operation: str, variables: dict, sha256_hash: str) -> str:
+    """GET-URL persisted query: переменные и extensions в query string."""
+    extensions = {"persistedQuery": {"version": 1, "sha256Hash": sha256_hash}}
+    ve = urllib.parse.quote(json.dumps(variables, separators=(",", ":")))
+    ee = urllib.parse.quote(json.dumps(extensions, separators=(",", ":")))
+    return f"{graphql_url}?operationName={operation}&variables={ve}&extensions={ee}"
+
+def details_from_gql_sale(sale: dict) -> dict:
+    """Поля NftSale* (из gqlCache или ответа GraphQL) в формате nft_offers, цены в нанотонах."""
+    return {
+        "royalties_address": sale.get("royaltyAddress"),
+        "royalty_amount":    nano(sale.get("royaltyAmount")),
+        "fee_total":         nano(sale.get("marketplaceFee")),
+        "sale_type":         sale.get("__typename"),
+    }
+
+def build_details_query(tokens: list) -> dict:
+    """
+    Запрос на пачку: по алиасу t{i} на каждый токен, адреса в переменных.
+    Текст зависит только от размера пачки, поэтому хэшей — не больше
+    detail_batch_size.
+    """
+    params = ", ".join(f"$a{i}: String!" for i in range(len(tokens)))
+    fields = "\n".join(
+        f"  t{i}: nftItemByAddress(address: $a{i}) {{\n"
+        f"    address\n"
+        f"    sale {{\n"
+        f"      __typename\n"
+        f"      ... on NftSaleFixPrice {{ royaltyAddress royaltyAmount marketplaceFee }}\n"
+        f"    }}\n"
+        f"  }}"
+        for i in range(len(tokens))
+    )
+    query = f"query nftDetailsBatch({params}) {{\n{fields}\n}}"
+    return {
+        "operationName": "nftDetailsBatch",
+        "query":         query,
+        "variables":     {f"a{i}": t for i, t in enumerate(tokens)},
+        "extensions":    {"persistedQuery": {
+            "version": 1, "sha256Hash": hashlib.sha256(query.encode("utf-8")).hexdigest()
+        }},
+    }
+
+def _persisted_query_not_found(data: dict) -> bool:
+    for err in data.get("errors") or []:
+        code = (err.get("extensions") or {}).get("code")
+        if code == "PERSISTED_QUERY_NOT_FOUND" or err.get("message") == "PersistedQueryNotFound":
+            return True
+    return False
+
+def parse_details_response(tokens: list, data: dict) -> dict:
+    """
+    token -> details. Токены без данных в ответе не попадают в результат,
+    чтобы вызывающий мог уйти на HTML-фоллбек.
+    """
+    items = data.get("data") or {}
+    result = {}
+    for i, token in enumerate(tokens):
+        item = items.get(f"t{i}")
+        if not item:
+            continue
+        sale = item.get("sale") or {}
+        details = details_from_gql_sale(sale) if sale else {}
+        details["nft_address"] = item.get("address")
+        result[token] = details
+    return result
+
+class GraphQLDetailLoader:
+    """
+    Собирает одиночные load(token) в пачки до detail_batch_size токенов или
+    до истечения detail_batch_window секунд и выполняет их одним запросом.
+    """
+
+    def __init__(self, cfg: dict, session, logger):
+        self.cfg = cfg
+        self.session = session
+        self.logger = logger
+        self.batch_size = cfg["detail_batch_size"]
+        self.window = cfg["detail_batch_window"]
+        self.disabled = False
+        self._pending = []
+        self._timer = None
+        # Ссылки на задачи пачек: иначе их может собрать сборщик мусора
+        self._tasks = set()
+        self._schema_errors = 0
+
+    async def load(self, token: str):
+        """details для токена или None, если GraphQL его не вернул."""
+        if self.disabled:
+            return None
+        fut = asyncio.get_running_loop().create_future()
+        self._pending.append((token, fut))
+        if len(self._pending) >= self.batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.window, self._flush)
+        return await fut
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.create_task(self._run_batch(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _request(self, tokens: list) -> dict:
+        """Ответ GraphQL на пачку: persisted query, при незнакомом хэше — регистрация POST."""
+        headers = {
+            "Accept":       "*/*",
+            "Content-Type": "application/json",
+            "x-gg-client":  self.cfg["x_gg_client"]
+        }
+        query = build_details_query(tokens)
+        url = persisted_query_url(self.cfg["graphql_url"], query["operationName"], query["variables"],
+                                  query["extensions"]["persistedQuery"]["sha256Hash"])
+        resp = await self.session.get(url, headers=headers)
+        data = await resp.json(content_type=None)
+        if _persisted_query_not_found(data):
+            resp = await self.session.post(self.cfg["graphql_url"], headers=headers, json=query)
+            data = await resp.json(content_type=None)
+        if resp.status != 200:
+            self.logger.warning(f"graphql details status {resp.status} for {len(tokens)} tokens")
+        return data if isinstance(data, dict) else {}
+
+    async def _run_batch(self, batch: list):
+        tokens = [t for t, _ in batch]
+        start = time.perf_counter()
+        results = {}
+        try:
+            data = await self._request(tokens)
+            results = parse_details_response(tokens, data)
+            errors = data.get("errors")
+            if errors:
+                messages = "; ".join(
+                    str(e.get("message", e)) if isinstance(e, dict) else str(e) for e in errors[:3]
+                )
+                self.logger.warning(f"graphql details errors ({len(errors)}): {messages}")
+            if results:
+                self._schema_errors = 0
+            elif errors or not data:
+                self._failed()
+            elapsed = time.perf_counter() - start
+            self.logger.info(f"graphql details: {len(results)}/{len(tokens)} tokens in {elapsed:.2f}s")
+        except Exception as e:
+            elapsed = time.perf_counter() - start
+            self.logger.warning(f"graphql details error for {len(tokens)} tokens after {elapsed:.2f}s: {e}")
+            # Не-JSON (HTML-страница ошибки) или сбой запроса — тоже неудачная пачка
+            self._failed()
+        finally:
+            # Ожидающие load() получают ответ и при отмене задачи — None уводит на HTML
+            for token, fut in batch:
+                if not fut.done():
+                    fut.set_result(results.get(token))
+
+    def _failed(self):
+        """Пачка без данных: после MAX_SCHEMA_ERRORS подряд бэкенд отключается."""
+        self._schema_errors += 1
+        if self._schema_errors >= MAX_SCHEMA_ERRORS and not self.disabled:
+            self.disabled = True
+            self.logger.error(
+                f"graphql details failed {self._schema_errors} times in a row, "
+                f"falling back to HTML details"
+            )
+
+    async def close(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        for _, fut in self._pending:
+            if not fut.done():
+                fut.set_result(None)
+        self._pending = []
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+core/next_data.py
+
+Быстрое извлечение JSON из <script id="__NEXT_DATA__"> без построения
+DOM-дерева: поиск тега по сырым байтам страницы и срез его содержимого.
+"""
+
+import json
+import re
+
+NEXT_DATA_ID = b"__NEXT_DATA__"
+SCRIPT_OPEN = b"<script"
+SCRIPT_CLOSE = b"</script"
+
+def _as_bytes(html) -> bytes:
+    return html.encode("utf-8") if isinstance(html, str) else bytes(html)
+
+def find_next_data(raw: bytes, start: int = 0):
+    """
+    Границы содержимого скрипта __NEXT_DATA__: (begin, end) или None.
+    end == -1, если закрывающий тег ещё не получен (неполная страница).
+    """
+    pos = start
+    while True:
+        idx = raw.find(NEXT_DATA_ID, pos)
+        if idx < 0:
+            return None
+        tag_start = raw.rfind(SCRIPT_OPEN, 0, idx)
+        tag_end = raw.find(b">", idx)
+        # Вхождение должно быть атрибутом открывающего тега <script ...>
+        if tag_start >= 0 and tag_end >= 0 and raw.find(b">", tag_start, idx) < 0:
+            begin = tag_end + 1
+            return begin, raw.find(SCRIPT_CLOSE, begin)
+        if tag_end < 0:
+            return None
+        pos = idx + len(NEXT_DATA_ID)
+
+def extract_next_data(html):
+    """Содержимое __NEXT_DATA__ в байтах или None, если тег не найден целиком."""
+    raw = _as_bytes(html)
+    bounds = find_next_data(raw)
+    if bounds is None or bounds[1] < 0:
+        return None
+    payload = raw[bounds[0]:bounds[1]]
+    return payload if payload.strip() else None
+
+_GQL_CACHE = re.compile(rb'"gqlCache"\s*:\s*\{')
+_STRING = re.compile(rb'"[^"\\]*(?:\\.[^"\\]*)*"', re.S)
+_WS = re.compile(rb'\s*')
+# Ключ записи вместе с двоеточием и разделитель после значения — по одному совпадению
+_KEY = re.compile(rb'("[^"\\]*(?:\\.[^"\\]*)*")\s*:\s*', re.S)
+_SEP = re.compile(rb'\s*([,}])\s*')
+_SCALAR = re.compile(rb'[^,}\]\s]+')
+# Всё до ближайшей скобки вне строк; строки проходятся целиком
+_TO_BRACKET = re.compile(rb'[^"{}\[\]]*(?:"[^"\\]*(?:\\.[^"\\]*)*"[^"{}\[\]]*)*([{}\[\]])', re.S)
+
+def _nested(depth: int) -> bytes:
+    """
+    Шаблон объекта/массива с вложенностью до depth: re не умеет рекурсию,
+    поэтому уровни разворачиваются. Каждая альтернатива начинается со своего
+    символа, так что шаблон не backtrack'ит экспоненциально.
+    """
+    string = rb'"[^"\\]*(?:\\.[^"\\]*)*"'
+    other = rb'[^"{}\[\]]*'
+    pattern = rb'[{\[]' + other + rb'(?:' + string + other + rb')*[}\]]'
+    for _ in range(depth - 1):
+        pattern = rb'[{\[]' + other + rb'(?:(?:' + string + rb'|' + pattern + rb')' + other + rb')*[}\]]'
+    return pattern
+
+# Типичная запись кэша Apollo пропускается одним совпадением; глубже — по
+# скобкам. Больше уровней — длиннее шаблон и медленнее каждое совпадение
+_CONTAINER = re.compile(_nested(3), re.S)
+
+def _skip_value(raw: bytes, pos: int) -> int:
+    """
+    Конец JSON-значения, начинающегося в pos, без его разбора: для объектов и
+    массивов считается глубина скобок вне строк. Содержимое не проверяется —
+    нужные значения потом разбирает json.loads.
+    """
+    first = raw[pos:pos + 1]
+    if first == b'"':
+        m = _STRING.match(raw, pos)
+    elif first in (b"{", b"["):
+        m = _CONTAINER.match(raw, pos)
+        if m is not None:
+            return m.end()
+        depth = 1
+        pos += 1
+        while depth:
+            m = _TO_BRACKET.match(raw, pos)
+            if m is None:
+                raise ValueError("unterminated JSON value")
+            pos = m.end()
+            depth += 1 if m.group(1) in b"{[" else -1
+        return pos
+    else:
+        m = _SCALAR.match(raw, pos)
+    if m is None:
+        raise ValueError(f"bad JSON value at {pos}")
+    return m.end()
+
+def select_gql_cache(payload) -> dict:
+    """
+    Выборочный разбор gqlCache из JSON __NEXT_DATA__: обходятся только ключи
+    верхнего уровня gqlCache (нормализованный кэш Apollo, "Typename:id").
+    Значения записей NftSale* и первой NftItem* разбираются json.loads, прочие
+    пропускаются по скобкам без построения объектов; JSON после закрывающей
+    скобки gqlCache не читается. Возвращает None, если нужных записей не
+    нашлось или JSON не разобрался — тогда нужен полный json.loads.
+
+    По времени это медленнее json.loads (регулярные выражения против сканера
+    на C), зато пик памяти в разы ниже — см. tests/bench_next_data.py.
+    """
+    raw = _as_bytes(payload)
+    m = _GQL_CACHE.search(raw)
+    if m is None:
+        return None
+    cache = {}
+    has_item = False
+    pos = _WS.match(raw, m.end()).end()
+    try:
+        if raw[pos:pos + 1] == b"}":
+            return None
+        while True:
+            km = _KEY.match(raw, pos)
+            if km is None:
+                return None
+            end = _skip_value(raw, km.end())
+            raw_key = km.group(1)
+            # Ключ декодируется, только если запись может понадобиться
+            if raw_key.startswith(b'"NftSale') or (not has_item and raw_key.startswith(b'"NftItem')) \
+                    or b"\\" in raw_key:
+                key = json.loads(raw_key)
+                if key.startswith("NftSale") or (key.startswith("NftItem") and not has_item):
+                    cache[key] = json.loads(raw[km.end():end])
+                    has_item = has_item or key.startswith("NftItem")
+            sm = _SEP.match(raw, end)
+            if sm is None:
+                return None
+            pos = sm.end()
+            # Закрывающая скобка gqlCache — дальше не сканируем
+            if sm.group(1) == b"}":
+                break
+    except ValueError:
+        return None
+    return cache or None
+
+async def read_until_next_data(resp, chunk_size: int = 16384) -> bytes:
+    """
+    Читает тело ответа aiohttp по частям до закрывающего тега __NEXT_DATA__
+    и закрывает соединение, не дочитывая остаток страницы. Возвращает
+    прочитанный префикс (или всю страницу, если тег не найден).
+    """
+    buf = bytearray()
+    begin = None
+    complete = False
+    async for chunk in resp.content.iter_chunked(chunk_size):
+        prev_len = len(buf)
+        buf += chunk
+        if begin is None:
+            # Перекрытие с прошлым чанком — тег мог разорваться на границе
+            bounds = find_next_data(buf, max(0, prev_len - 256))
+            if bounds is None:
+                continue
+            begin, end = bounds
+        else:
+            end = buf.find(SCRIPT_CLOSE, max(begin, prev_len - len(SCRIPT_CLOSE)))
+        if end >= 0:
+            del buf[end + len(SCRIPT_CLOSE):]
+            complete = True
+            break
+    if complete:
+        # Остаток страницы не нужен: соединение не возвращается в пул
+        resp.close()
+    return bytes(buf)
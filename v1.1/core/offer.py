@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+core/offer.py
+
+Запись оффера между парсером, писателем БД и нотификатором. Цены — целые
+нанотоны в том виде, в каком их отдаёт API; в TON они переводятся только
+при выводе (format_ton). Поля деталей продажи, которые не удалось
+получить, остаются UNSET и не затирают значения в БД.
+"""
+
+# Нанотонов в одном TON
+NANO = 10**9
+
+class _Unset:
+    __slots__ = ()
+
+    def __repr__(self):
+        return "UNSET"
+
+    def __bool__(self):
+        return False
+
+UNSET = _Unset()
+
+def nano(value):
+    """Строка/число нанотонов из API -> int; пустое значение -> None."""
+    return int(value) if value else None
+
+def format_ton(value) -> str:
+    """Нанотоны -> строка TON без потери точности (до 9 знаков)."""
+    if value is None:
+        return "—"
+    whole, frac = divmod(value, NANO)
+    return f"{whole}.{frac:09d}".rstrip("0").rstrip(".")
+
+class Offer:
+    # Поля листинга приходят всегда (значение может быть None)
+    LIST_FIELDS = (
+        "token_address", "phone_number", "sale_contract", "sale_price", "sale_fee",
+        "max_offer_price", "prev_owners_count", "owner_address",
+    )
+    # Поля деталей продажи — UNSET, пока детали не получены
+    DETAIL_FIELDS = ("royalties_address", "royalty_amount", "fee_total", "sale_type", "nft_address")
+    # Поля-цены в нанотонах
+    PRICE_FIELDS = ("sale_price", "sale_fee", "max_offer_price", "royalty_amount", "fee_total")
+
+    __slots__ = LIST_FIELDS + DETAIL_FIELDS
+
+    def __init__(self, token_address: str, phone_number=None, sale_contract=None, sale_price=None,
+                 sale_fee=None, max_offer_price=None, prev_owners_count=None, owner_address=None,
+                 royalties_address=UNSET, royalty_amount=UNSET, fee_total=UNSET, sale_type=UNSET,
+                 nft_address=UNSET):
+        # Явные присваивания: конструктор вызывается на каждый узел листинга
+        self.token_address = token_address
+        self.phone_number = phone_number
+        self.sale_contract = sale_contract
+        self.sale_price = sale_price
+        self.sale_fee = sale_fee
+        self.max_offer_price = max_offer_price
+        self.prev_owners_count = prev_owners_count
+        self.owner_address = owner_address
+        self.royalties_address = royalties_address
+        self.royalty_amount = royalty_amount
+        self.fee_total = fee_total
+        self.sale_type = sale_type
+        self.nft_address = nft_address
+
+    def __repr__(self):
+        return f"Offer({self.token_address!r}, price={format_ton(self.sale_price)})"
+
+    @property
+    def effective_price(self):
+        """sale_price + sale_fee в нанотонах (комиссия None = 0); None — не выставлен."""
+        if self.sale_price is None:
+            return None
+        return self.sale_price + (self.sale_fee or 0)
+
+    def with_details(self, details: dict) -> "Offer":
+        """Применяет словарь деталей (details_from_gql_sale и т.п.) и возвращает self."""
+        for k, v in details.items():
+            if k in self.DETAIL_FIELDS:
+                setattr(self, k, v)
+        return self
+
+    def merge(self, other: "Offer") -> "Offer":
+        """Более свежая запись того же токена: поля листинга и полученные детали из other."""
+        for f in self.LIST_FIELDS:
+            setattr(self, f, getattr(other, f))
+        for f in self.DETAIL_FIELDS:
+            v = getattr(other, f)
+            if v is not UNSET:
+                setattr(self, f, v)
+        return self
+
+    def to_row(self) -> dict:
+        """Колонки nft_offers; детали, которые не были получены, не включаются."""
+        row = {f: getattr(self, f) for f in self.LIST_FIELDS}
+        for f in self.DETAIL_FIELDS:
+            v = getattr(self, f)
+            if v is not UNSET:
+                row[f] = v
+        return row
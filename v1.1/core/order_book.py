@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+core/order_book.py
+
+Стакан активных листингов коллекции в памяти: отсортированный контейнер
+ключей (эффективная цена, токен) и словарь токен -> ключ. Вставка,
+изменение и удаление — O(log n); floor, k-й по дешевизне и ранг токена —
+O(log n). Цены — целые нанотоны. Заполняется из nft_offers при старте и
+обновляется по результатам парсера или по журналу offer_events.
+"""
+
+from sortedcontainers import SortedList
+
+import aiosqlite
+
+from core.offer import Offer
+from storage.db import get_active_listings
+
+class OrderBook:
+    def __init__(self):
+        self._book = SortedList()
+        # token -> (eff, token): текущий ключ токена в _book
+        self._keys = {}
+
+    def __len__(self) -> int:
+        return len(self._book)
+
+    def __contains__(self, token: str) -> bool:
+        return token in self._keys
+
+    def price(self, token: str):
+        key = self._keys.get(token)
+        return key[0] if key is not None else None
+
+    def upsert(self, token: str, eff) -> bool:
+        """
+        Выставляет токен по цене eff (None — снимает с продажи).
+
+        Returns:
+            bool: Изменилась ли позиция токена в стакане
+        """
+        if eff is None:
+            return self.remove(token)
+        key = (eff, token)
+        old = self._keys.get(token)
+        if old == key:
+            return False
+        if old is not None:
+            self._book.remove(old)
+        self._book.add(key)
+        self._keys[token] = key
+        return True
+
+    def update(self, rec: Offer) -> bool:
+        """upsert по записи парсера."""
+        if not rec.token_address:
+            return False
+        return self.upsert(rec.token_address, rec.effective_price)
+
+    def remove(self, token: str) -> bool:
+        key = self._keys.pop(token, None)
+        if key is None:
+            return False
+        self._book.remove(key)
+        return True
+
+    def retain(self, tokens) -> int:
+        """Удаляет всё, чего нет в tokens (полный листинг цикла). Returns: сколько удалено."""
+        keep = set(tokens)
+        gone = [t for t in self._keys if t not in keep]
+        for token in gone:
+            self.remove(token)
+        return len(gone)
+
+    def floor(self):
+        """(eff, token) самого дешёвого оффера или None."""
+        return self.kth(0)
+
+    def kth(self, k: int):
+        """(eff, token) k-го по дешевизне оффера (с нуля) или None."""
+        if 0 <= k < len(self._book):
+            return self._book[k]
+        return None
+
+    def head(self, n: int) -> list:
+        """n самых дешёвых офферов: список (eff, token)."""
+        return list(self._book.islice(0, n))
+
+    def rank(self, token: str):
+        """Позиция токена по дешевизне (с нуля) или None, если его нет в стакане."""
+        key = self._keys.get(token)
+        if key is None:
+            return None
+        return self._book.index(key)
+
+    def apply_event(self, event: tuple) -> bool:
+        """
+        Применяет строку offer_events (см. storage.db.fetch_events).
+
+        Returns:
+            bool: Изменилась ли позиция токена в стакане
+        """
+        _, token, event_type, _, new_price = event[:5]
+        if event_type == "delisted":
+            return self.remove(token)
+        return self.upsert(token, new_price)
+
+    async def load(self, conn: aiosqlite.Connection) -> int:
+        """
+        Тёплый старт: стакан заново заполняется активными листингами из nft_offers.
+
+        Returns:
+            int: Количество офферов в стакане
+        """
+        rows = await get_active_listings(conn)
+        self._keys = {token: (eff, token) for token, eff in rows}
+        self._book = SortedList(self._keys.values())
+        return len(self._book)
@@ -4,14 +4,16 @@
 """
 notify_floor_alerts.py
 
-Асинхронный нотификатор floor gap для Telegram.
+Асинхронный нотификатор floor gap для Telegram (alert_mode: polling).
 Обработка сигналов через signal.signal, безопасная работа с БД и HTTP.
+Правила и доставка — core.alerts.AlertEngine; в режиме inline тот же движок
+работает внутри парсера, и этот процесс не нужен.
 """
 
 import asyncio
+import contextlib
 import signal
 import sys
-import json
 from pathlib import Path
 from datetime import datetime
 
@@ -19,18 +21,28 @@ from utils.config import load_config
 from utils.async_session import AsyncSession
 import aiosqlite
 from utils.logging_cfg import setup_logger
-from storage.db import get_offers_for_notifications, get_connection, close_connection
+from utils.telegram import TelegramSender, ChatRegistry, UpdatePoller
+from core.alerts import AlertEngine
+from core.order_book import OrderBook
+from storage.connections import ConnectionManager, open_connections
+from storage.db import (
+    init_tables,
+    register_consumer,
+    get_last_event_id,
+    fetch_events,
+    ack_events,
+)
 
 cfg = load_config("prod")
 DB_PATH = Path("getgems_offers.db")
-CHATS_FILE = Path("chats.json")
+CHATS_FILE = Path(cfg["chats_file"])
 
-# Параметры алертов
-TRASH_COUNT    = cfg.get("trash_count", 5)
-SUPER_FACTOR   = cfg.get("super_factor", 0.96)
-HALF_FACTOR    = cfg.get("half_factor", 0.98)
 NOTIFY_INTERVAL = cfg.get("notify_interval_seconds", 60)
 
+# Имя потребителя журнала offer_events
+EVENT_CONSUMER = "notify_floor_alerts"
+EVENT_BATCH = 500
+
 logger = setup_logger("notify_floor_alerts", cfg["log_level"])
 running = True
 
@@ -46,117 +58,73 @@ try:
 except AttributeError:
     pass  # Windows may not have SIGTERM
 
-async def load_chats() -> set:
-    if CHATS_FILE.exists():
-        return set(json.loads(CHATS_FILE.read_text(encoding="utf-8")))
-    return set()
-
-async def save_chats(chats: set):
-    CHATS_FILE.write_text(json.dumps(list(chats)), encoding="utf-8")
-
-async def update_chats(session: AsyncSession) -> set:
-    chats = await load_chats()
-    url = f"https://api.telegram.org/bot{cfg['bot_token']}/getUpdates"
-    try:
-        resp = await session.get(url)
-        data = await resp.json()
-        for u in data.get("result", []):
-            if "message" in u:
-                chats.add(u["message"]["chat"]["id"])
-            if "callback_query" in u:
-                chats.add(u["callback_query"]["from"]["id"])
-        if data.get("result"):
-            last = data["result"][-1]["update_id"]
-            await session.get(f"{url}?offset={last+1}")
-    except Exception as e:
-        logger.warning("getUpdates error: %s", e)
-    await save_chats(chats)
-    logger.info("Known chats: %d", len(chats))
-    return chats
-
-def compute_thresholds(prices: list[float]) -> tuple[float, float] | tuple[None, None]:
-    if len(prices) < 2:
-        return None, None
-    return prices[0], prices[1]
-
-def make_message(url: str, rec: dict, label: str) -> str:
-    lines = [f"{label}\n{url}"]
-    for k, v in rec.items():
-        lines.append(f"{k}: {v}")
-    return "\n".join(lines)
-
-async def send_all(session: AsyncSession, chats: set, text: str):
-    url = f"https://api.telegram.org/bot{cfg['bot_token']}/sendMessage"
-    for cid in chats:
-        try:
-            await session.post(url, json={
-                "chat_id": cid,
-                "text": text,
-                "disable_web_page_preview": True
-            })
-        except Exception as e:
-            logger.error("Send error to %s: %s", cid, e)
+async def warm_start(db: ConnectionManager, book: OrderBook):
+    """
+    Стакан заполняется из nft_offers, курсор потребителя ставится на конец
+    журнала: события до него уже отражены в таблице.
+    """
+    await register_consumer(db.writer, EVENT_CONSUMER)
+    async with db.read() as conn:
+        last_id = await get_last_event_id(conn)
+        n = await book.load(conn)
+    await ack_events(db.writer, EVENT_CONSUMER, last_id)
+    logger.info("Order book warm start: %d active offers", n)
+
+async def apply_events(db: ConnectionManager, book: OrderBook) -> int:
+    """Применяет к стакану все новые события журнала и сдвигает курсор."""
+    applied = 0
+    while True:
+        async with db.read() as conn:
+            events = await fetch_events(conn, EVENT_CONSUMER, EVENT_BATCH)
+        if not events:
+            return applied
+        for ev in events:
+            book.apply_event(ev)
+        await ack_events(db.writer, EVENT_CONSUMER, events[-1][0])
+        applied += len(events)
 
 async def notifier_loop():
+    if cfg["alert_mode"] == "inline":
+        # Два процесса не могут одновременно держать long polling getUpdates
+        logger.error("alert_mode is inline: alerts are sent by the parser, notifier not started")
+        return
     session = AsyncSession()
-    db = await get_connection()
-    # Чтение офферов для алертов
-    seen_trash = set()
-    seen_half  = set()
-    seen_super = set()
-
-    chats = await update_chats(session)
-    if chats:
-        await send_all(session, chats, "🔔 Notifier started")
+    sender = TelegramSender(
+        session, cfg["bot_token"], logger,
+        concurrency=cfg["telegram_concurrency"],
+        chat_rps=cfg["telegram_chat_rps"],
+        max_retries=cfg["telegram_max_retries"],
+    )
+    # Чтение — через пул read-only соединений, запись (курсор журнала) — через писателя
+    db = await open_connections(cfg, str(DB_PATH))
+    await init_tables(db.writer)
+    book = OrderBook()
+    await warm_start(db, book)
+
+    # Чаты обновляет фоновый long polling; цикл алертов его не ждёт
+    registry = ChatRegistry(CHATS_FILE)
+    poller = UpdatePoller(session, cfg["bot_token"], registry, logger, cfg["telegram_poll_timeout"])
+    poll_task = asyncio.create_task(poller.run())
+    logger.info("Known chats: %d", len(registry.chats))
+    engine = AlertEngine(cfg, book, db, sender, registry, logger)
+    await engine.broadcast("🔔 Notifier started")
 
     global running
     while running:
         try:
-            chats = await update_chats(session)
-            rows = await get_offers_for_notifications(db, TRASH_COUNT)
-            effs = [p + f for _, p, f, _, _, _ in rows]
-            floor, second = compute_thresholds(effs)
-
-            for idx, (token, p, f, ramt, ftot, created) in enumerate(rows, start=1):
-                eff = p + f
-                url = (
-                    f"https://getgems.io/collection/"
-                    f"{cfg['collection_address']}/{token}?modalId=sale_info"
-                )
-                rec = {
-                    "sale_price":       p,
-                    "sale_fee":         f,
-                    "royalty_amount":   ramt,
-                    "fee_total":        ftot,
-                    "created_at":       created
-                }
-
-                # Trash alert: новые в топ-N
-                if token not in seen_trash:
-                    label = f"🗑️ Trash Alert: new #{idx}"
-                    await send_all(session, chats, make_message(url, rec, label))
-                    seen_trash.add(token)
-
-                # Half & Super alerts
-                if floor is not None and second is not None:
-                    half_thr  = floor * HALF_FACTOR
-                    super_thr = floor * SUPER_FACTOR
-                    if eff <= half_thr and token not in seen_half:
-                        label = "⚠️ Half Alert (−2%)"
-                        await send_all(session, chats, make_message(url, rec, label))
-                        seen_half.add(token)
-                    if eff <= super_thr and token not in seen_super:
-                        label = "🔥 Super Alert (−4%)"
-                        await send_all(session, chats, make_message(url, rec, label))
-                        seen_super.add(token)
-
+            await apply_events(db, book)
+            # Сводку образуют алерты одного прохода, окно не нужно
+            await engine.run_once(flush=True)
         except Exception as e:
             logger.exception("Notifier loop error: %s", e)
 
         await asyncio.sleep(NOTIFY_INTERVAL)
 
+    poll_task.cancel()
+    with contextlib.suppress(asyncio.CancelledError):
+        await poll_task
     await session.close()
-    await close_connection(db)
+    await db.close()
     logger.info("Notifier shutdown complete")
 
 def main():
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+storage/connections.py
+
+Разделение соединений процесса: одно соединение-писатель и пул соединений
+только для чтения. В WAL читатели не блокируют писателя и друг друга, а
+собственные соединения не делят с писателем поток aiosqlite, поэтому чтение
+не стоит в очереди за пачкой upsert.
+"""
+
+import asyncio
+import contextlib
+
+from storage.db import DB_PATH, get_connection, get_read_connection, close_connection
+
+class ConnectionManager:
+    def __init__(self, path: str = DB_PATH, readers: int = 2, read_mmap_size: int = 256 * 1024 * 1024,
+                 read_cache_kib: int = 65536, wal_size_limit: int = 64 * 1024 * 1024):
+        self.path = path
+        self.readers = max(1, readers)
+        self.read_mmap_size = read_mmap_size
+        self.read_cache_kib = read_cache_kib
+        self.wal_size_limit = wal_size_limit
+        self.writer = None
+        self._pool = asyncio.Queue()
+        self._all = []
+
+    async def open(self):
+        # Писатель первым: он создаёт файл и включает WAL
+        self.writer = await get_connection(self.path)
+        # После контрольной точки файл -wal усекается до этого размера
+        await self.writer.execute(f"PRAGMA journal_size_limit={int(self.wal_size_limit)}")
+        for _ in range(self.readers):
+            conn = await get_read_connection(self.path, self.read_mmap_size, self.read_cache_kib)
+            self._all.append(conn)
+            self._pool.put_nowait(conn)
+
+    @contextlib.asynccontextmanager
+    async def read(self):
+        """``async with manager.read() as conn:`` — соединение для чтения из пула."""
+        conn = await self._pool.get()
+        try:
+            yield conn
+        finally:
+            self._pool.put_nowait(conn)
+
+    async def close(self):
+        for conn in self._all:
+            await close_connection(conn)
+        self._all = []
+        self._pool = asyncio.Queue()
+        await close_connection(self.writer)
+        self.writer = None
+
+async def open_connections(cfg: dict, path: str = DB_PATH) -> ConnectionManager:
+    """ConnectionManager с параметрами из конфигурации (db_read_*, wal_size_limit_mb)."""
+    manager = ConnectionManager(
+        path,
+        readers=cfg["db_read_connections"],
+        read_mmap_size=cfg["db_read_mmap_mb"] * 1024 * 1024,
+        read_cache_kib=cfg["db_read_cache_mb"] * 1024,
+        wal_size_limit=cfg["wal_size_limit_mb"] * 1024 * 1024,
+    )
+    await manager.open()
+    return manager
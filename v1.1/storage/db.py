@@ -6,12 +6,25 @@ storage/db.py
 
 Асинхронная работа с SQLite через aiosqlite с поддержкой WAL-режима
 и защитой от блокировок при параллельном доступе.
+
+Цены в nft_offers и offer_events — целые нанотоны (схема версии 1, см.
+SCHEMA_VERSION); в TON они переводятся только при выводе.
 """
 
+import hashlib
 import aiosqlite
-from datetime import datetime
+from datetime import datetime, timedelta
+
+from core.offer import Offer
+from storage.history import init_history_tables
+from storage.outbox import init_outbox_tables
+
+DB_PATH = "getgems_offers.db"
 
-async def get_connection(path: str = "getgems_offers.db") -> aiosqlite.Connection:
+# PRAGMA user_version: 1 — цены в нанотонах (INTEGER) вместо TON (REAL)
+SCHEMA_VERSION = 1
+
+async def get_connection(path: str = DB_PATH) -> aiosqlite.Connection:
     """
     Асинхронное подключение к SQLite с настройкой WAL-режима и таймаутом.
     
@@ -35,14 +48,29 @@ async def get_connection(path: str = "getgems_offers.db") -> aiosqlite.Connectio
     await conn.commit()
     return conn
 
-async def init_tables(conn: aiosqlite.Connection):
+async def get_read_connection(path: str = DB_PATH, mmap_size: int = 256 * 1024 * 1024,
+                              cache_kib: int = 65536) -> aiosqlite.Connection:
     """
-    Создание таблиц в БД асинхронно.
-    
+    Соединение только для чтения: query_only, чтение страниц через mmap и
+    увеличенный кэш. Режим WAL уже включён писателем и хранится в файле БД.
+
     Args:
-        conn: Соединение с базой данных
+        path: Путь к файлу базы данных
+        mmap_size: Размер отображения файла в память, байт (0 — без mmap)
+        cache_kib: Размер кэша страниц, КиБ
+
+    Returns:
+        aiosqlite.Connection: Соединение для чтения
     """
-    await conn.execute("""
+    conn = await aiosqlite.connect(path, timeout=10.0)
+    await conn.execute("PRAGMA query_only=1")
+    await conn.execute(f"PRAGMA mmap_size={int(mmap_size)}")
+    # Отрицательное значение cache_size — размер в КиБ, а не в страницах
+    await conn.execute(f"PRAGMA cache_size=-{int(cache_kib)}")
+    await conn.execute("PRAGMA temp_store=MEMORY")
+    return conn
+
+_NFT_OFFERS_DDL = """
       CREATE TABLE IF NOT EXISTS nft_offers (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         token_address TEXT UNIQUE,
@@ -50,109 +78,521 @@ async def init_tables(conn: aiosqlite.Connection):
         collection_name TEXT,
         collection_type TEXT,
         sale_contract TEXT,
-        sale_price REAL,
-        sale_fee REAL,
+        sale_price INTEGER,
+        sale_fee INTEGER,
         sale_currency TEXT,
-        max_offer_price REAL,
+        max_offer_price INTEGER,
         prev_owners_count INTEGER,
-        last_sale_price REAL,
+        last_sale_price INTEGER,
         last_sale_date TEXT,
         owner_address TEXT,
         royalties_address TEXT,
-        royalty_amount REAL,
-        fee_total REAL,
-        full_price REAL,
+        royalty_amount INTEGER,
+        fee_total INTEGER,
+        full_price INTEGER,
         currency TEXT,
         sale_type TEXT,
         nft_address TEXT,
+        content_hash TEXT,
+        last_seen_at TEXT,
+        is_active INTEGER NOT NULL DEFAULT 1,
+        delisted_at TEXT,
         updated_at TEXT,
         created_at TEXT
       )
-    """)
+    """
+
+_OFFER_EVENTS_DDL = """
+      CREATE TABLE IF NOT EXISTS offer_events (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        token_address TEXT NOT NULL,
+        event_type TEXT NOT NULL,
+        old_price INTEGER,
+        new_price INTEGER,
+        old_owner TEXT,
+        new_owner TEXT,
+        created_at TEXT NOT NULL
+      )
+"""
+
+# Колонки-цены, которые до версии 1 хранились в TON
+_NANO_COLUMNS = {
+    "nft_offers": ("sale_price", "sale_fee", "max_offer_price", "last_sale_price",
+                   "royalty_amount", "fee_total", "full_price"),
+    "offer_events": ("old_price", "new_price"),
+}
+
+async def _rebuild_table(conn: aiosqlite.Connection, table: str, ddl: str, nano_columns: tuple):
+    """
+    Пересоздаёт таблицу по новому DDL с переводом цен из TON в нанотоны.
+    Индексы и триггеры старой таблицы удаляются вместе с ней и создаются
+    заново в init_tables.
+    """
+    await conn.execute(f"ALTER TABLE {table} RENAME TO {table}_old")
+    await conn.execute(ddl)
+    cursor = await conn.execute(f"PRAGMA table_info({table}_old)")
+    old_columns = {row[1] for row in await cursor.fetchall()}
+    # table_info не показывает генерируемые колонки — их и не нужно копировать
+    cursor = await conn.execute(f"PRAGMA table_info({table})")
+    columns = [row[1] for row in await cursor.fetchall() if row[1] in old_columns]
+    select = ", ".join(
+        f"CAST(ROUND({c} * 1e9) AS INTEGER)" if c in nano_columns else c for c in columns
+    )
+    await conn.execute(
+        f"INSERT INTO {table} ({', '.join(columns)}) SELECT {select} FROM {table}_old"
+    )
+    await conn.execute(f"DROP TABLE {table}_old")
+
+async def _migrate_schema(conn: aiosqlite.Connection):
+    """
+    Миграция существующей БД до SCHEMA_VERSION одной транзакцией. Новая БД
+    сразу создаётся в актуальной схеме и только получает номер версии.
+
+    Args:
+        conn: Соединение с базой данных
+    """
+    cursor = await conn.execute("PRAGMA user_version")
+    version = (await cursor.fetchone())[0]
+    if version >= SCHEMA_VERSION:
+        return
+    cursor = await conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+    tables = {row[0] for row in await cursor.fetchall()}
+    try:
+        await conn.execute("BEGIN IMMEDIATE")
+        if version < 1 and "nft_offers" in tables:
+            # Служебные колонки, которых может не быть в совсем старой схеме
+            await _ensure_columns(conn, "nft_offers", {
+                "content_hash": "TEXT",
+                "last_seen_at": "TEXT",
+                "is_active": "INTEGER NOT NULL DEFAULT 1",
+                "delisted_at": "TEXT",
+            })
+            await _rebuild_table(conn, "nft_offers", _NFT_OFFERS_DDL, _NANO_COLUMNS["nft_offers"])
+            # Хэши посчитаны по TON-значениям; первый цикл перезапишет строки
+            await conn.execute("UPDATE nft_offers SET content_hash = NULL")
+            if "offer_events" in tables:
+                await _rebuild_table(conn, "offer_events", _OFFER_EVENTS_DDL, _NANO_COLUMNS["offer_events"])
+        await conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        await conn.commit()
+    except Exception as e:
+        await conn.rollback()
+        raise e
+
+async def _drop_effective_price_column(conn: aiosqlite.Connection):
+    """
+    Удаляет генерируемую колонку effective_price из БД, созданных до перехода
+    индекса и запросов на выражение _EFF_PRICE: её никто не читал, а STORED-
+    вариант пересчитывался и записывался в каждую строку. Индексы по ней
+    удаляются первыми (с ними DROP COLUMN невозможен).
+    """
+    cursor = await conn.execute("PRAGMA table_xinfo(nft_offers)")
+    if not any(row[1] == "effective_price" for row in await cursor.fetchall()):
+        return
+    await conn.execute("DROP INDEX IF EXISTS idx_active_effective_price")
+    await conn.execute("DROP INDEX IF EXISTS idx_active_listings")
+    await conn.execute("ALTER TABLE nft_offers DROP COLUMN effective_price")
+
+async def init_tables(conn: aiosqlite.Connection):
+    """
+    Создание таблиц в БД асинхронно.
+    
+    Args:
+        conn: Соединение с базой данных
+    """
+    await _migrate_schema(conn)
+    await conn.execute(_NFT_OFFERS_DDL)
+    # Колонки, добавленные после первой версии схемы
+    await _ensure_columns(conn, "nft_offers", {
+        "content_hash": "TEXT",
+        "last_seen_at": "TEXT",
+        "is_active": "INTEGER NOT NULL DEFAULT 1",
+        "delisted_at": "TEXT",
+    })
+    await _drop_effective_price_column(conn)
     
     await conn.execute("CREATE INDEX IF NOT EXISTS idx_token_address ON nft_offers(token_address)")
     await conn.execute("CREATE INDEX IF NOT EXISTS idx_updated_at ON nft_offers(updated_at)")
     await conn.execute("CREATE INDEX IF NOT EXISTS idx_sale_price ON nft_offers(sale_price)")
     await conn.execute("CREATE INDEX IF NOT EXISTS idx_created_at ON nft_offers(created_at)")
+    # Индекс с устаревшим определением пересоздаётся
+    cursor = await conn.execute(
+        "SELECT sql FROM sqlite_master WHERE type = 'index' AND name = 'idx_active_listings'"
+    )
+    row = await cursor.fetchone()
+    if row is not None and row[0] != _ACTIVE_LISTINGS_INDEX:
+        await conn.execute("DROP INDEX idx_active_listings")
+        row = None
+    if row is None:
+        await conn.execute(_ACTIVE_LISTINGS_INDEX)
+
+    await init_event_tables(conn)
+    await init_history_tables(conn)
+    await init_outbox_tables(conn)
     
     await conn.commit()
 
-async def upsert_offer(conn: aiosqlite.Connection, data: dict):
+# Эффективная цена: комиссия None считается нулевой
+_EFF_PRICE = "sale_price + COALESCE(sale_fee, 0)"
+
+# Частичный покрывающий индекс для floor/top-N по активным листингам. Ключ —
+# выражение, а не генерируемая колонка: при ключе по ней SQLite читает строку
+# таблицы на каждую запись индекса. Колонки из WHERE запроса тоже должны быть
+# в индексе
+_ACTIVE_LISTINGS_INDEX = (
+    f"CREATE INDEX idx_active_listings ON nft_offers"
+    f"({_EFF_PRICE}, token_address, sale_price, sale_fee, is_active) "
+    f"WHERE sale_price IS NOT NULL AND is_active = 1"
+)
+
+_ACTIVE_LISTINGS = f"""
+  SELECT token_address, {_EFF_PRICE}
+    FROM nft_offers
+   WHERE sale_price IS NOT NULL AND is_active = 1
+   ORDER BY {_EFF_PRICE} ASC
+"""
+
+# Эффективная цена строки в триггерах (то же, что _EFF_PRICE)
+_EFF = "{row}.sale_price + COALESCE({row}.sale_fee, 0)"
+
+async def init_event_tables(conn: aiosqlite.Connection):
     """
-    Асинхронная вставка или обновление оффера с минимальным временем блокировки.
-    
+    Журнал изменений офферов offer_events и курсоры его потребителей.
+
+    События пишутся триггерами на nft_offers в той же транзакции, что и
+    upsert: new_listing (в том числе повторное выставление), price_change,
+    owner_change, delisted. AUTOINCREMENT гарантирует, что id не
+    переиспользуются после очистки, поэтому курсор по id надёжен.
+
     Args:
         conn: Соединение с базой данных
-        data: Словарь с данными оффера
     """
-    token = data.get("token_address")
-    if not token:
-        return
+    await conn.execute(_OFFER_EVENTS_DDL)
+    await conn.execute("""
+      CREATE TABLE IF NOT EXISTS event_consumers (
+        name TEXT PRIMARY KEY,
+        last_event_id INTEGER NOT NULL DEFAULT 0,
+        updated_at TEXT
+      )
+    """)
+
+    def event(event_type: str) -> str:
+        return f"""
+          INSERT INTO offer_events
+              (token_address, event_type, old_price, new_price, old_owner, new_owner, created_at)
+          VALUES (NEW.token_address, '{event_type}', {{old_price}}, {_EFF.format(row="NEW")},
+                  {{old_owner}}, NEW.owner_address, strftime('%Y-%m-%dT%H:%M:%f', 'now'));
+        """
+
+    on_insert = event("new_listing").format(old_price="NULL", old_owner="NULL")
+    with_old = {"old_price": _EFF.format(row="OLD"), "old_owner": "OLD.owner_address"}
+    triggers = {
+        "trg_event_insert": f"""
+          AFTER INSERT ON nft_offers
+          BEGIN {on_insert} END
+        """,
+        "trg_event_price": f"""
+          AFTER UPDATE OF sale_price, sale_fee ON nft_offers
+          WHEN OLD.is_active = 1 AND NEW.is_active = 1
+           AND ({_EFF.format(row="NEW")}) IS NOT ({_EFF.format(row="OLD")})
+          BEGIN {event("price_change").format(**with_old)} END
+        """,
+        "trg_event_owner": f"""
+          AFTER UPDATE OF owner_address ON nft_offers
+          WHEN OLD.is_active = 1 AND NEW.is_active = 1
+           AND NEW.owner_address IS NOT OLD.owner_address
+          BEGIN {event("owner_change").format(**with_old)} END
+        """,
+        "trg_event_delisted": f"""
+          AFTER UPDATE OF is_active ON nft_offers
+          WHEN OLD.is_active = 1 AND NEW.is_active = 0
+          BEGIN {event("delisted").format(**with_old)} END
+        """,
+        "trg_event_relisted": f"""
+          AFTER UPDATE OF is_active ON nft_offers
+          WHEN OLD.is_active = 0 AND NEW.is_active = 1
+          BEGIN {event("new_listing").format(**with_old)} END
+        """,
+    }
+    for name, body in triggers.items():
+        await conn.execute(f"CREATE TRIGGER IF NOT EXISTS {name} {body}")
+
+async def _ensure_columns(conn: aiosqlite.Connection, table: str, columns: dict):
+    """
+    Добавляет недостающие колонки в существующую таблицу.
+
+    Args:
+        conn: Соединение с базой данных
+        table: Имя таблицы
+        columns: Словарь {колонка: определение}
+    """
+    # table_xinfo, в отличие от table_info, видит и генерируемые колонки
+    cursor = await conn.execute(f"PRAGMA table_xinfo({table})")
+    existing = {row[1] for row in await cursor.fetchall()}
+    for name, decl in columns.items():
+        if name not in existing:
+            await conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {decl}")
+
+# Служебные поля, не входящие в хэш содержимого оффера
+_HASH_EXCLUDED = ("token_address", "content_hash", "last_seen_at", "is_active", "delisted_at",
+                  "updated_at", "created_at")
+
+def offer_content_hash(data: dict) -> str:
+    """
+    Хэш бизнес-полей оффера. Совпадение хэша означает, что перезапись строки
+    ничего не изменит.
+    """
+    items = sorted((k, v) for k, v in data.items() if k not in _HASH_EXCLUDED)
+    return hashlib.blake2b(repr(items).encode("utf-8"), digest_size=16).hexdigest()
+
+async def upsert_offers(conn: aiosqlite.Connection, records: list) -> int:
+    """
+    Пакетная вставка или обновление офферов одной транзакцией.
+
+    INSERT ... ON CONFLICT(token_address) DO UPDATE через executemany;
+    created_at существующих записей сохраняется. Записи группируются по
+    набору полей, чтобы отсутствующие в записи поля (например, детали,
+    которые не удалось получить) не затирались NULL.
+
+    Args:
+        conn: Соединение с базой данных
+        records: Список Offer (или словарей с колонками nft_offers)
 
+    Returns:
+        int: Количество записанных офферов
+    """
     now = datetime.utcnow().isoformat()
-    data["updated_at"] = now
+    groups = {}
+    for data in records:
+        row = data.to_row() if isinstance(data, Offer) else dict(data)
+        if not row.get("token_address"):
+            continue
+        row["updated_at"] = now
+        row.setdefault("created_at", now)
+        row["content_hash"] = offer_content_hash(row)
+        # Оффер в листинге — активен, даже если ранее был снят с продажи
+        row["is_active"] = 1
+        row["delisted_at"] = None
+        groups.setdefault(tuple(row.keys()), []).append(row)
+    if not groups:
+        return 0
 
+    # rowcount, а не total_changes: последний учитывает и строки, вставленные
+    # триггерами истории и журнала событий
+    changed = 0
     try:
-        # Начинаем транзакцию
         await conn.execute("BEGIN IMMEDIATE")
-        
-        # Проверяем существование записи
-        cursor = await conn.execute(
-            "SELECT created_at FROM nft_offers WHERE token_address = ?",
-            (token,)
-        )
-        row = await cursor.fetchone()
-
-        if row:
-            # Обновляем существующую запись, сохраняя оригинальную created_at
-            data["created_at"] = row[0]
-            fields = list(data.keys())
-            set_clause = ", ".join(f"{f}=?" for f in fields)
-            values = [data[f] for f in fields] + [token]
-            await conn.execute(
-                f"UPDATE nft_offers SET {set_clause} WHERE token_address = ?",
-                values
+        for fields, rows in groups.items():
+            columns = ", ".join(fields)
+            placeholders = ", ".join("?" for _ in fields)
+            updates = ", ".join(
+                f"{f}=excluded.{f}" for f in fields if f not in ("token_address", "created_at")
             )
-        else:
-            # Новая запись
-            data["created_at"] = data.get("created_at", now)
-            columns = ", ".join(data.keys())
-            placeholders = ", ".join("?" for _ in data)
-            await conn.execute(
-                f"INSERT INTO nft_offers ({columns}) VALUES ({placeholders})",
-                list(data.values())
+            cursor = await conn.executemany(
+                f"INSERT INTO nft_offers ({columns}) VALUES ({placeholders}) "
+                f"ON CONFLICT(token_address) DO UPDATE SET {updates} "
+                f"WHERE nft_offers.content_hash IS NOT excluded.content_hash OR nft_offers.is_active = 0",
+                [[row[f] for f in fields] for row in rows]
             )
+            changed += cursor.rowcount
+        await conn.commit()
+    except Exception as e:
+        await conn.rollback()
+        raise e
+    return changed
+
+async def mark_seen_offers(conn: aiosqlite.Connection, tokens: list, delist_unseen: bool = False,
+                           seen_at: str = None, max_price: int = None) -> list:
+    """
+    Отметка офферов, увиденных в листинге за цикл: набор адресов грузится во
+    временную таблицу, после чего last_seen_at и снятие с продажи
+    обновляются одним запросом на множество, а не построчно.
 
-        # Коммитим транзакцию
+    Args:
+        conn: Соединение с базой данных
+        tokens: Адреса токенов, увиденных в листинге
+        delist_unseen: Пометить активные офферы, которых нет в tokens, как
+            снятые с продажи
+        seen_at: Время отметки (по умолчанию — текущее)
+        max_price: Для оборванного листинга (он отсортирован по цене) —
+            снимать только офферы с sale_price строго ниже этой цены;
+            None — листинг прочитан целиком, снимаются все неувиденные
+
+    Returns:
+        list: Адреса офферов, помеченных снятыми с продажи
+    """
+    seen_at = seen_at or datetime.utcnow().isoformat()
+    delisted = []
+    try:
+        await conn.execute(
+            "CREATE TEMP TABLE IF NOT EXISTS seen_tokens (token_address TEXT PRIMARY KEY) WITHOUT ROWID"
+        )
+        await conn.execute("BEGIN IMMEDIATE")
+        await conn.execute("DELETE FROM temp.seen_tokens")
+        await conn.executemany(
+            "INSERT OR IGNORE INTO temp.seen_tokens (token_address) VALUES (?)",
+            [(t,) for t in tokens if t]
+        )
+        await conn.execute("""
+          UPDATE nft_offers SET last_seen_at = ?
+           WHERE token_address IN (SELECT token_address FROM temp.seen_tokens)
+        """, (seen_at,))
+        if delist_unseen:
+            # Офферы ровно по max_price могут продолжаться на непрочитанной странице
+            bound = "" if max_price is None else "AND sale_price < ?"
+            cursor = await conn.execute(f"""
+              UPDATE nft_offers SET is_active = 0, delisted_at = ?
+               WHERE is_active = 1
+                 AND token_address NOT IN (SELECT token_address FROM temp.seen_tokens)
+                 {bound}
+              RETURNING token_address
+            """, (seen_at,) if max_price is None else (seen_at, max_price))
+            delisted = [row[0] for row in await cursor.fetchall()]
         await conn.commit()
-        
     except Exception as e:
-        # Откатываем транзакцию в случае ошибки
         await conn.rollback()
         raise e
+    return delisted
 
-async def get_offers_for_notifications(conn: aiosqlite.Connection, limit: int = 5) -> list:
+async def wal_checkpoint(conn: aiosqlite.Connection, mode: str = "PASSIVE") -> tuple:
     """
-    Получение офферов для нотификаций с минимальным временем блокировки.
-    
+    Контрольная точка WAL.
+
     Args:
         conn: Соединение с базой данных
-        limit: Количество записей для получения
-        
+        mode: PASSIVE, FULL, RESTART или TRUNCATE
+
+    Returns:
+        tuple: (busy, кадров в WAL, перенесено кадров)
+    """
+    cursor = await conn.execute(f"PRAGMA wal_checkpoint({mode})")
+    return await cursor.fetchone()
+
+async def get_active_listings(conn: aiosqlite.Connection, limit: int = None) -> list:
+    """
+    Активные листинги по возрастанию эффективной цены — проход по индексу
+    idx_active_listings без сортировки и без чтения строк таблицы.
+
+    Args:
+        conn: Соединение с базой данных
+        limit: Сколько самых дешёвых вернуть (None — все)
+
+    Returns:
+        list: Кортежи (token_address, эффективная цена в нанотонах)
+    """
+    sql = _ACTIVE_LISTINGS if limit is None else _ACTIVE_LISTINGS + " LIMIT ?"
+    cursor = await conn.execute(sql, () if limit is None else (limit,))
+    return await cursor.fetchall()
+
+async def get_offers_by_tokens(conn: aiosqlite.Connection, tokens: list) -> dict:
+    """
+    Данные офферов по списку токенов (поиск по первичному ключу).
+
+    Args:
+        conn: Соединение с базой данных
+        tokens: Адреса токенов
+
     Returns:
-        list: Список кортежей с данными офферов
+        dict: token_address -> (token_address, sale_price, sale_fee, royalty_amount,
+              fee_total, created_at)
     """
-    sql = """
+    if not tokens:
+        return {}
+    placeholders = ",".join("?" * len(tokens))
+    cursor = await conn.execute(f"""
       SELECT token_address, sale_price, sale_fee, royalty_amount, fee_total, created_at
         FROM nft_offers
-       WHERE sale_price IS NOT NULL
-       ORDER BY (sale_price + sale_fee) ASC
-       LIMIT ?
+       WHERE token_address IN ({placeholders})
+    """, list(tokens))
+    return {row[0]: row for row in await cursor.fetchall()}
+
+async def register_consumer(conn: aiosqlite.Connection, name: str, from_start: bool = False):
     """
-    
-    cursor = await conn.execute(sql, (limit,))
+    Регистрация потребителя журнала событий (повторный вызов ничего не меняет).
+
+    Args:
+        conn: Соединение с базой данных
+        name: Имя потребителя
+        from_start: Читать журнал с начала; иначе — только новые события
+    """
+    start_sql = "0" if from_start else "(SELECT COALESCE(MAX(id), 0) FROM offer_events)"
+    await conn.execute(f"""
+      INSERT OR IGNORE INTO event_consumers (name, last_event_id, updated_at)
+      VALUES (?, {start_sql}, ?)
+    """, (name, datetime.utcnow().isoformat()))
+    await conn.commit()
+
+async def get_last_event_id(conn: aiosqlite.Connection) -> int:
+    """id последнего события журнала (0, если журнал пуст)."""
+    cursor = await conn.execute("SELECT COALESCE(MAX(id), 0) FROM offer_events")
+    return (await cursor.fetchone())[0]
+
+async def fetch_events(conn: aiosqlite.Connection, consumer: str, limit: int = 500) -> list:
+    """
+    События после курсора потребителя (курсор не сдвигается — см. ack_events).
+
+    Args:
+        conn: Соединение с базой данных
+        consumer: Имя зарегистрированного потребителя
+        limit: Максимум событий за вызов
+
+    Returns:
+        list: Кортежи (id, token_address, event_type, old_price, new_price,
+            old_owner, new_owner, created_at)
+    """
+    cursor = await conn.execute("""
+      SELECT id, token_address, event_type, old_price, new_price, old_owner, new_owner, created_at
+        FROM offer_events
+       WHERE id > (SELECT last_event_id FROM event_consumers WHERE name = ?)
+       ORDER BY id
+       LIMIT ?
+    """, (consumer, limit))
     return await cursor.fetchall()
 
+async def ack_events(conn: aiosqlite.Connection, consumer: str, event_id: int):
+    """
+    Сдвиг курсора потребителя: события до event_id включительно обработаны.
+
+    Args:
+        conn: Соединение с базой данных
+        consumer: Имя потребителя
+        event_id: id последнего обработанного события
+    """
+    await conn.execute("""
+      UPDATE event_consumers
+         SET last_event_id = MAX(last_event_id, ?), updated_at = ?
+       WHERE name = ?
+    """, (event_id, datetime.utcnow().isoformat(), consumer))
+    await conn.commit()
+
+async def prune_events(conn: aiosqlite.Connection, max_age_days: int = 0) -> int:
+    """
+    Удаление событий, подтверждённых всеми потребителями, а при max_age_days > 0 —
+    и всех событий старше этого срока (защита от брошенных потребителей).
+
+    Args:
+        conn: Соединение с базой данных
+        max_age_days: Предельный возраст события, дней (0 — без ограничения)
+
+    Returns:
+        int: Количество удалённых событий
+    """
+    try:
+        await conn.execute("BEGIN IMMEDIATE")
+        cursor = await conn.execute("""
+          DELETE FROM offer_events
+           WHERE id <= (SELECT MIN(last_event_id) FROM event_consumers)
+        """)
+        removed = cursor.rowcount
+        if max_age_days > 0:
+            cutoff = (datetime.utcnow() - timedelta(days=max_age_days)).isoformat()
+            cursor = await conn.execute("DELETE FROM offer_events WHERE created_at < ?", (cutoff,))
+            removed += cursor.rowcount
+        await conn.commit()
+    except Exception as e:
+        await conn.rollback()
+        raise e
+    return removed
+
 async def close_connection(conn: aiosqlite.Connection):
     """
     Безопасное закрытие соединения с БД.
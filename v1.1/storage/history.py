@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+storage/history.py
+
+История цен офферов: строка в offer_price_history появляется только при
+реальной смене цены, комиссии, владельца, контракта продажи или при снятии
+с продажи и повторном выставлении (триггеры на nft_offers). Цены — целые
+нанотоны, как и в nft_offers; eff_nano — эффективная цена (sale_price +
+sale_fee) выставленного оффера, NULL — оффер не продаётся. Старые данные
+сворачиваются в почасовые и подневные агрегаты min/max/last эффективной
+цены и удаляются по сроку хранения.
+"""
+
+import aiosqlite
+from datetime import datetime, timedelta
+from sortedcontainers import SortedList
+
+# Время в БД — ISO-строки datetime.utcnow().isoformat(), начало корзины
+# получается обрезкой строки
+_BUCKETS = {
+    "hour": "substr({col}, 1, 13) || ':00:00'",
+    "day":  "substr({col}, 1, 10) || 'T00:00:00'",
+}
+
+_STEPS = {"hour": timedelta(hours=1), "day": timedelta(days=1)}
+
+# Снятие с продажи не меняет updated_at — время берётся из delisted_at
+_HISTORY_ROW = """
+    INSERT INTO offer_price_history
+        (token_address, ts, price_nano, fee_nano, eff_nano, owner_address, sale_contract)
+    VALUES (
+        NEW.token_address,
+        COALESCE(CASE WHEN NEW.is_active = 0 THEN NEW.delisted_at END, NEW.updated_at,
+                 strftime('%Y-%m-%dT%H:%M:%f', 'now')),
+        NEW.sale_price,
+        NEW.sale_fee,
+        CASE WHEN NEW.is_active = 1 THEN NEW.sale_price + COALESCE(NEW.sale_fee, 0) END,
+        NEW.owner_address,
+        NEW.sale_contract
+    );
+"""
+
+async def init_history_tables(conn: aiosqlite.Connection):
+    """
+    Таблицы истории, индексы и триггеры на nft_offers.
+
+    Args:
+        conn: Соединение с базой данных
+    """
+    await conn.execute("""
+      CREATE TABLE IF NOT EXISTS offer_price_history (
+        id INTEGER PRIMARY KEY,
+        token_address TEXT NOT NULL,
+        ts TEXT NOT NULL,
+        price_nano INTEGER,
+        fee_nano INTEGER,
+        eff_nano INTEGER,
+        owner_address TEXT,
+        sale_contract TEXT
+      )
+    """)
+    cursor = await conn.execute("PRAGMA table_info(offer_price_history)")
+    if "eff_nano" not in {row[1] for row in await cursor.fetchall()}:
+        # Старые строки записывались только для выставленных офферов
+        await conn.execute("ALTER TABLE offer_price_history ADD COLUMN eff_nano INTEGER")
+        await conn.execute(
+            "UPDATE offer_price_history SET eff_nano = price_nano + COALESCE(fee_nano, 0)"
+        )
+    await conn.execute("""
+      CREATE TABLE IF NOT EXISTS offer_price_rollup (
+        token_address TEXT NOT NULL,
+        bucket TEXT NOT NULL,
+        bucket_start TEXT NOT NULL,
+        min_price_nano INTEGER,
+        max_price_nano INTEGER,
+        last_price_nano INTEGER,
+        PRIMARY KEY (token_address, bucket, bucket_start)
+      ) WITHOUT ROWID
+    """)
+    await conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_price_history_token_ts ON offer_price_history(token_address, ts)"
+    )
+    await conn.execute("CREATE INDEX IF NOT EXISTS idx_price_history_ts ON offer_price_history(ts)")
+    await conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_price_rollup_bucket ON offer_price_rollup(bucket, bucket_start)"
+    )
+
+    # Триггеры пересоздаются: в старых версиях не было eff_nano и is_active
+    await conn.execute("DROP TRIGGER IF EXISTS trg_price_history_insert")
+    await conn.execute("DROP TRIGGER IF EXISTS trg_price_history_update")
+    await conn.execute(f"""
+      CREATE TRIGGER trg_price_history_insert
+      AFTER INSERT ON nft_offers
+      BEGIN {_HISTORY_ROW} END
+    """)
+    await conn.execute(f"""
+      CREATE TRIGGER trg_price_history_update
+      AFTER UPDATE OF sale_price, sale_fee, owner_address, sale_contract, is_active ON nft_offers
+      WHEN NEW.sale_price IS NOT OLD.sale_price
+        OR NEW.sale_fee IS NOT OLD.sale_fee
+        OR NEW.owner_address IS NOT OLD.owner_address
+        OR NEW.sale_contract IS NOT OLD.sale_contract
+        OR NEW.is_active IS NOT OLD.is_active
+      BEGIN {_HISTORY_ROW} END
+    """)
+
+async def _rollup(conn: aiosqlite.Connection, source_sql: str, bucket: str, cutoff: str):
+    """Сливает строки источника старше cutoff в агрегаты корзины bucket."""
+    await conn.execute(f"""
+      INSERT INTO offer_price_rollup
+          (token_address, bucket, bucket_start, min_price_nano, max_price_nano, last_price_nano)
+      SELECT token_address, ?, bucket_start, MIN(min_p), MAX(max_p), last_p
+        FROM (
+          SELECT token_address, bucket_start, min_p, max_p,
+                 LAST_VALUE(last_p) OVER (
+                   PARTITION BY token_address, bucket_start ORDER BY ts
+                   ROWS BETWEEN UNBOUNDED PRECEDING AND UNBOUNDED FOLLOWING
+                 ) AS last_p
+            FROM ({source_sql})
+           WHERE ts < ?
+        )
+       GROUP BY token_address, bucket_start
+      ON CONFLICT(token_address, bucket, bucket_start) DO UPDATE SET
+        min_price_nano  = MIN(COALESCE(min_price_nano, excluded.min_price_nano),
+                              COALESCE(excluded.min_price_nano, min_price_nano)),
+        max_price_nano  = MAX(COALESCE(max_price_nano, excluded.max_price_nano),
+                              COALESCE(excluded.max_price_nano, max_price_nano)),
+        last_price_nano = excluded.last_price_nano
+    """, (bucket, cutoff))
+
+async def downsample_price_history(conn: aiosqlite.Connection, raw_days: int, hourly_days: int,
+                                   daily_days: int, now: datetime = None) -> dict:
+    """
+    Сворачивает сырую историю старше raw_days в почасовые агрегаты, почасовые
+    старше hourly_days — в подневные, и удаляет подневные старше daily_days
+    (0 — хранить бессрочно). Всё выполняется одной транзакцией.
+
+    Args:
+        conn: Соединение с базой данных
+        raw_days: Срок хранения сырых изменений, дней
+        hourly_days: Срок хранения почасовых агрегатов, дней
+        daily_days: Срок хранения подневных агрегатов, дней
+
+    Returns:
+        dict: Количество удалённых строк по уровням
+    """
+    now = now or datetime.utcnow()
+    raw_cutoff = (now - timedelta(days=raw_days)).isoformat()
+    hourly_cutoff = (now - timedelta(days=hourly_days)).isoformat()
+    hour_expr = _BUCKETS["hour"].format(col="ts")
+    day_expr = _BUCKETS["day"].format(col="bucket_start")
+    removed = {}
+    try:
+        await conn.execute("BEGIN IMMEDIATE")
+        # Корзина, в которую попадает cutoff, сворачивается частично; остаток
+        # сольётся в неё же при следующем запуске
+        await _rollup(conn, f"""
+            SELECT token_address, ts, {hour_expr} AS bucket_start,
+                   eff_nano AS min_p, eff_nano AS max_p, eff_nano AS last_p
+              FROM offer_price_history
+        """, "hour", raw_cutoff)
+        cursor = await conn.execute("DELETE FROM offer_price_history WHERE ts < ?", (raw_cutoff,))
+        removed["raw"] = cursor.rowcount
+
+        await _rollup(conn, f"""
+            SELECT token_address, bucket_start AS ts, {day_expr} AS bucket_start,
+                   min_price_nano AS min_p, max_price_nano AS max_p, last_price_nano AS last_p
+              FROM offer_price_rollup
+             WHERE bucket = 'hour'
+        """, "day", hourly_cutoff)
+        cursor = await conn.execute(
+            "DELETE FROM offer_price_rollup WHERE bucket = 'hour' AND bucket_start < ?", (hourly_cutoff,)
+        )
+        removed["hour"] = cursor.rowcount
+
+        removed["day"] = 0
+        if daily_days > 0:
+            daily_cutoff = (now - timedelta(days=daily_days)).isoformat()
+            cursor = await conn.execute(
+                "DELETE FROM offer_price_rollup WHERE bucket = 'day' AND bucket_start < ?", (daily_cutoff,)
+            )
+            removed["day"] = cursor.rowcount
+        await conn.commit()
+    except Exception as e:
+        await conn.rollback()
+        raise e
+    return removed
+
+async def get_price_history(conn: aiosqlite.Connection, token: str, since: str, until: str) -> list:
+    """
+    Сырые изменения цены токена за период.
+
+    Returns:
+        list: Кортежи (ts, price_nano, fee_nano, eff_nano, owner_address, sale_contract)
+    """
+    cursor = await conn.execute("""
+      SELECT ts, price_nano, fee_nano, eff_nano, owner_address, sale_contract
+        FROM offer_price_history
+       WHERE token_address = ? AND ts >= ? AND ts < ?
+       ORDER BY ts
+    """, (token, since, until))
+    return await cursor.fetchall()
+
+async def get_price_rollups(conn: aiosqlite.Connection, token: str, bucket: str,
+                            since: str, until: str) -> list:
+    """
+    Агрегаты эффективной цены токена за период (last NULL — к концу корзины
+    оффер снят с продажи).
+
+    Returns:
+        list: Кортежи (bucket_start, min_price_nano, max_price_nano, last_price_nano)
+    """
+    cursor = await conn.execute("""
+      SELECT bucket_start, min_price_nano, max_price_nano, last_price_nano
+        FROM offer_price_rollup
+       WHERE token_address = ? AND bucket = ? AND bucket_start >= ? AND bucket_start < ?
+       ORDER BY bucket_start
+    """, (token, bucket, since, until))
+    return await cursor.fetchall()
+
+async def get_floor_history(conn: aiosqlite.Connection, since: str, until: str,
+                            bucket: str = "hour") -> list:
+    """
+    Floor коллекции по корзинам времени: минимальная эффективная цена среди
+    офферов, выставленных в какой-либо момент корзины. Состояние на начало
+    корзины — последняя известная цена каждого токена (снятые с продажи не
+    учитываются), к нему добавляются цены, выставленные внутри корзины.
+    Источники — сырые изменения и уже свёрнутые агрегаты.
+
+    Args:
+        conn: Соединение с базой данных
+        since: Начало периода (ISO), округляется вниз до начала корзины
+        until: Конец периода (ISO), не включается
+        bucket: hour или day
+
+    Returns:
+        list: Кортежи (bucket_start, floor_price_nano) для корзин, где floor известен
+    """
+    expr = _BUCKETS[bucket]
+    start = datetime.fromisoformat(since).replace(minute=0, second=0, microsecond=0)
+    if bucket == "day":
+        start = start.replace(hour=0)
+    since = start.isoformat()
+
+    # Последняя известная цена каждого токена до начала периода
+    cursor = await conn.execute("""
+      SELECT token_address, p, MAX(ts) FROM (
+        SELECT token_address, ts, eff_nano AS p
+          FROM offer_price_history
+         WHERE ts < ?
+        UNION ALL
+        SELECT token_address, bucket_start AS ts, last_price_nano AS p
+          FROM offer_price_rollup
+         WHERE bucket_start < ?
+      )
+       GROUP BY token_address
+    """, (since, since))
+    state = {token: p for token, p, _ in await cursor.fetchall() if p is not None}
+    listed = SortedList((p, token) for token, p in state.items())
+
+    # Изменения внутри периода: (корзина, токен, min за корзину, цена после)
+    cursor = await conn.execute(f"""
+      SELECT {expr.format(col="ts")}, token_address, eff_nano, eff_nano, ts
+        FROM offer_price_history
+       WHERE ts >= ? AND ts < ?
+      UNION ALL
+      SELECT {expr.format(col="bucket_start")}, token_address, min_price_nano, last_price_nano,
+             bucket_start
+        FROM offer_price_rollup
+       WHERE bucket_start >= ? AND bucket_start < ?
+       ORDER BY 5
+    """, (since, until, since, until))
+    changes = await cursor.fetchall()
+
+    result = []
+    i = 0
+    current = start
+    until_dt = datetime.fromisoformat(until)
+    while current < until_dt:
+        key = current.isoformat()
+        floor = listed[0][0] if listed else None
+        while i < len(changes) and changes[i][0] <= key:
+            _, token, low, last, _ = changes[i]
+            i += 1
+            if low is not None and (floor is None or low < floor):
+                floor = low
+            old = state.pop(token, None)
+            if old is not None:
+                listed.remove((old, token))
+            if last is not None:
+                state[token] = last
+                listed.add((last, token))
+        if floor is not None:
+            result.append((key, floor))
+        current += _STEPS[bucket]
+    return result
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+storage/outbox.py
+
+Исходящая очередь алертов нотификатора. Алерт разворачивается в строку на
+каждый чат с ключом дедупликации (токен, тип алерта, цена): повторная
+постановка того же алерта — даже после перезапуска — ничего не добавляет.
+Неудачные отправки повторяются с экспоненциальной задержкой; отправленные и
+окончательно неудачные строки удаляются по сроку хранения. priority (0 —
+самый важный) задаёт порядок алертов внутри сводного сообщения чату.
+"""
+
+import aiosqlite
+from datetime import datetime, timedelta
+
+async def init_outbox_tables(conn: aiosqlite.Connection):
+    """
+    Таблица alert_outbox и её индексы; в старую таблицу добавляется priority.
+
+    Args:
+        conn: Соединение с базой данных
+    """
+    await conn.execute("""
+      CREATE TABLE IF NOT EXISTS alert_outbox (
+        id INTEGER PRIMARY KEY,
+        dedupe_key TEXT NOT NULL,
+        chat_id INTEGER NOT NULL,
+        token_address TEXT NOT NULL,
+        alert_type TEXT NOT NULL,
+        price_nano INTEGER,
+        priority INTEGER NOT NULL DEFAULT 2,
+        text TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'pending',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        next_attempt_at TEXT NOT NULL,
+        last_error TEXT,
+        sent_at TEXT,
+        created_at TEXT NOT NULL,
+        UNIQUE (dedupe_key, chat_id)
+      )
+    """)
+    cursor = await conn.execute("PRAGMA table_info(alert_outbox)")
+    if "priority" not in {row[1] for row in await cursor.fetchall()}:
+        await conn.execute("ALTER TABLE alert_outbox ADD COLUMN priority INTEGER NOT NULL DEFAULT 2")
+    await conn.execute("""
+      CREATE INDEX IF NOT EXISTS idx_outbox_due
+          ON alert_outbox(next_attempt_at) WHERE status = 'pending'
+    """)
+    await conn.execute("CREATE INDEX IF NOT EXISTS idx_outbox_created ON alert_outbox(created_at)")
+
+def alert_key(token: str, alert_type: str, price_nano) -> str:
+    """Ключ дедупликации алерта."""
+    return f"{token}:{alert_type}:{price_nano}"
+
+async def get_known_alert_keys(conn: aiosqlite.Connection, keys: list) -> set:
+    """
+    Ключи, уже стоящие в очереди (в любом статусе).
+
+    Args:
+        conn: Соединение с базой данных
+        keys: Ключи alert_key
+
+    Returns:
+        set: Подмножество keys, для которых алерт уже ставился
+    """
+    if not keys:
+        return set()
+    placeholders = ",".join("?" * len(keys))
+    cursor = await conn.execute(
+        f"SELECT DISTINCT dedupe_key FROM alert_outbox WHERE dedupe_key IN ({placeholders})", list(keys)
+    )
+    return {row[0] for row in await cursor.fetchall()}
+
+async def enqueue_alert(conn: aiosqlite.Connection, chats, token: str, alert_type: str,
+                        price_nano, text: str, priority: int = 2) -> int:
+    """
+    Ставит алерт в очередь для каждого чата; уже поставленные пары
+    (ключ, чат) пропускаются.
+
+    Args:
+        conn: Соединение с базой данных
+        chats: id чатов-получателей
+        token: Адрес токена
+        alert_type: Тип алерта (trash, half, super)
+        price_nano: Эффективная цена в нанотонах
+        text: Текст сообщения
+        priority: Важность алерта, 0 — самый важный
+
+    Returns:
+        int: Количество добавленных строк
+    """
+    now = datetime.utcnow().isoformat()
+    key = alert_key(token, alert_type, price_nano)
+    try:
+        await conn.execute("BEGIN IMMEDIATE")
+        cursor = await conn.executemany("""
+          INSERT OR IGNORE INTO alert_outbox
+              (dedupe_key, chat_id, token_address, alert_type, price_nano, priority, text,
+               next_attempt_at, created_at)
+          VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, [(key, chat_id, token, alert_type, price_nano, priority, text, now, now)
+              for chat_id in chats])
+        added = cursor.rowcount
+        await conn.commit()
+    except Exception as e:
+        await conn.rollback()
+        raise e
+    return added
+
+async def fetch_due_alerts(conn: aiosqlite.Connection, limit: int = 500) -> list:
+    """
+    Алерты, которые пора отправить, в порядке постановки.
+
+    Returns:
+        list: Кортежи (id, chat_id, text, attempts, priority, created_at)
+    """
+    cursor = await conn.execute("""
+      SELECT id, chat_id, text, attempts, priority, created_at
+        FROM alert_outbox
+       WHERE status = 'pending' AND next_attempt_at <= ?
+       ORDER BY id
+       LIMIT ?
+    """, (datetime.utcnow().isoformat(), limit))
+    return await cursor.fetchall()
+
+async def complete_alerts(conn: aiosqlite.Connection, sent: list, failed: list,
+                          retry_base: float, max_attempts: int):
+    """
+    Результаты отправки одной транзакцией.
+
+    Args:
+        conn: Соединение с базой данных
+        sent: id отправленных строк
+        failed: Кортежи (id, attempts до этой попытки, текст ошибки)
+        retry_base: Задержка первого повтора, с (далее удваивается)
+        max_attempts: После стольких попыток строка получает статус failed
+    """
+    now = datetime.utcnow()
+    try:
+        await conn.execute("BEGIN IMMEDIATE")
+        await conn.executemany(
+            "UPDATE alert_outbox SET status = 'sent', sent_at = ?, attempts = attempts + 1 WHERE id = ?",
+            [(now.isoformat(), alert_id) for alert_id in sent]
+        )
+        rows = []
+        for alert_id, attempts, error in failed:
+            attempts += 1
+            status = "failed" if attempts >= max_attempts else "pending"
+            next_at = now + timedelta(seconds=retry_base * 2 ** (attempts - 1))
+            rows.append((status, attempts, next_at.isoformat(), error, alert_id))
+        await conn.executemany("""
+          UPDATE alert_outbox
+             SET status = ?, attempts = ?, next_attempt_at = ?, last_error = ?
+           WHERE id = ?
+        """, rows)
+        await conn.commit()
+    except Exception as e:
+        await conn.rollback()
+        raise e
+
+async def drop_chat_alerts(conn: aiosqlite.Connection, chats) -> int:
+    """
+    Снимает с очереди неотправленные алерты чатов, заблокировавших бота.
+
+    Returns:
+        int: Количество снятых строк
+    """
+    try:
+        await conn.execute("BEGIN IMMEDIATE")
+        cursor = await conn.executemany("""
+          UPDATE alert_outbox SET status = 'failed', last_error = 'blocked'
+           WHERE chat_id = ? AND status = 'pending'
+        """, [(chat_id,) for chat_id in chats])
+        dropped = cursor.rowcount
+        await conn.commit()
+    except Exception as e:
+        await conn.rollback()
+        raise e
+    return dropped
+
+async def prune_outbox(conn: aiosqlite.Connection, ttl_hours: float) -> int:
+    """
+    Удаляет строки старше ttl_hours: вместе с ними истекают и ключи
+    дедупликации, так что таблица не растёт бесконечно.
+
+    Returns:
+        int: Количество удалённых строк
+    """
+    cutoff = (datetime.utcnow() - timedelta(hours=ttl_hours)).isoformat()
+    try:
+        await conn.execute("BEGIN IMMEDIATE")
+        cursor = await conn.execute("DELETE FROM alert_outbox WHERE created_at < ?", (cutoff,))
+        removed = cursor.rowcount
+        await conn.commit()
+    except Exception as e:
+        await conn.rollback()
+        raise e
+    return removed
@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+storage/writer.py
+
+Единственный писатель в БД: долгоживущая задача на соединении-писателе
+ConnectionManager читает записи из ограниченной очереди, схлопывает
+повторные записи одного токена и коммитит их пачками через upsert_offers.
+Производители только ставят записи в очередь; заполненная очередь — явный
+backpressure. Писатель же отвечает за контрольные точки WAL.
+"""
+
+import asyncio
+import time
+
+from storage.db import (
+    init_tables,
+    upsert_offers,
+    mark_seen_offers,
+    prune_events,
+    wal_checkpoint,
+)
+from core.offer import Offer
+from storage.history import downsample_price_history
+
+_STOP = object()
+
+class OfferWriter:
+    def __init__(self, conn, batch_size: int, flush_interval: float, queue_size: int,
+                 logger, statistics=None, checkpoint_interval: float = 300.0,
+                 truncate_pages: int = 10000):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.logger = logger
+        self.statistics = statistics
+        self._queue = asyncio.Queue(maxsize=queue_size)
+        # Политика контрольных точек: PASSIVE в конце каждого цикла; TRUNCATE,
+        # если PASSIVE не успевает (в WAL >= truncate_pages кадров) или раз в
+        # checkpoint_interval секунд
+        self.checkpoint_interval = checkpoint_interval
+        self.truncate_pages = truncate_pages
+        self._last_truncate = time.monotonic()
+        self._conn = conn
+        self._task = None
+        self._page_size = 4096
+        # Изменённых строк с прошлого end_cycle
+        self._changed = 0
+
+    async def start(self):
+        await init_tables(self._conn)
+        cursor = await self._conn.execute("PRAGMA page_size")
+        self._page_size = (await cursor.fetchone())[0]
+        self._task = asyncio.create_task(self._run())
+
+    async def put(self, rec: Offer, urgent: bool = False):
+        """
+        Ставит запись в очередь. При urgent пачка сбрасывается сразу, и вызов
+        возвращается только после коммита.
+        """
+        if not urgent:
+            await self._queue.put(("rec", rec, None))
+            return
+        await self._call("rec", rec)
+
+    async def end_cycle(self, tokens: list, complete: bool = False, max_price: int = None) -> dict:
+        """
+        Завершение цикла: сброс очереди, пакетный heartbeat last_seen_at для
+        увиденных токенов, пометка неувиденных как снятых с продажи (при
+        complete — всех, иначе — дешевле max_price, если она задана) и
+        пассивная контрольная точка WAL.
+
+        Returns:
+            dict: changed — изменённых строк за цикл, delisted — снятых с
+            продажи, delisted_tokens — их адреса, wal_frames/wal_bytes — объём
+            WAL, записанный с прошлой контрольной точки
+        """
+        return await self._call("end_cycle", (list(tokens), complete, max_price))
+
+    async def maintain(self, raw_days: int, hourly_days: int, daily_days: int,
+                       events_max_age_days: int) -> dict:
+        """Свёртка истории цен и очистка журнала событий силами писателя."""
+        return await self._call("maintain", (raw_days, hourly_days, daily_days, events_max_age_days))
+
+    async def execute(self, fn, *args):
+        """
+        Выполняет fn(conn, *args) на соединении писателя между пачками — для
+        прочих записей (alert_outbox), чтобы в БД оставался один писатель.
+        Исключение fn пробрасывается вызывающему.
+        """
+        return await self._call("execute", (fn, args))
+
+    async def _call(self, op: str, arg):
+        fut = asyncio.get_running_loop().create_future()
+        await self._queue.put((op, arg, fut))
+        return await fut
+
+    async def close(self):
+        if self._task is not None:
+            await self._queue.put(_STOP)
+            await self._task
+            self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        pending = {}
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(0.0, deadline - loop.time())
+            try:
+                item = await asyncio.wait_for(self._queue.get(), timeout)
+            except asyncio.TimeoutError:
+                item = None
+            calls = []
+            stopping = False
+            # Забираем всё, что уже накопилось, без ожидания
+            while item is not None:
+                if item is _STOP:
+                    stopping = True
+                    break
+                op, arg, fut = item
+                if op == "rec":
+                    token = arg.token_address
+                    if token:
+                        # Последовательные upsert одного токена = слияние полей
+                        pending[token] = pending[token].merge(arg) if token in pending else arg
+                    if deadline is None:
+                        deadline = loop.time() + self.flush_interval
+                if fut is not None:
+                    calls.append((op, arg, fut))
+                if calls or len(pending) >= self.batch_size or self._queue.empty():
+                    break
+                item = self._queue.get_nowait()
+            if stopping or calls or len(pending) >= self.batch_size or \
+                    (deadline is not None and loop.time() >= deadline):
+                await self._flush(pending)
+                pending, deadline = {}, None
+            for op, arg, fut in calls:
+                result = None
+                if op == "execute":
+                    fn, args = arg
+                    try:
+                        result = await fn(self._conn, *args)
+                    except Exception as e:
+                        if not fut.done():
+                            fut.set_exception(e)
+                        continue
+                elif op == "end_cycle":
+                    result = await self._end_cycle(*arg)
+                elif op == "maintain":
+                    result = await self._maintain(*arg)
+                if not fut.done():
+                    fut.set_result(result)
+            if stopping:
+                return
+
+    async def _flush(self, pending: dict):
+        if not pending:
+            return
+        start = time.perf_counter()
+        try:
+            changed = await upsert_offers(self._conn, list(pending.values()))
+            self._changed += changed
+            elapsed = time.perf_counter() - start
+            if self.statistics is not None:
+                self.statistics.add_stage_time("db_flush", elapsed)
+            self.logger.info(f"Upserted {len(pending)} offers ({changed} changed) in {elapsed:.3f}s "
+                             f"(queue {self._queue.qsize()})")
+        except Exception as e:
+            if self.statistics is not None:
+                self.statistics.add_error()
+            self.logger.error(f"upsert_offers failed for {len(pending)} offers: {e}")
+
+    async def _end_cycle(self, tokens: list, complete: bool, max_price: int) -> dict:
+        result = {"changed": self._changed, "delisted": 0, "delisted_tokens": [],
+                  "wal_frames": None, "wal_bytes": None}
+        self._changed = 0
+        try:
+            delist = complete or max_price is not None
+            delisted = await mark_seen_offers(self._conn, tokens, delist_unseen=delist,
+                                              max_price=None if complete else max_price)
+            result["delisted"] = len(delisted)
+            result["delisted_tokens"] = delisted
+            # Кадры WAL с прошлой контрольной точки ≈ объём записи за цикл
+            _, frames, done = await wal_checkpoint(self._conn, "PASSIVE")
+            if frames >= 0:
+                result["wal_frames"] = frames
+                result["wal_bytes"] = frames * (self._page_size + 24)
+                await self._maybe_truncate_wal(frames, done)
+        except Exception as e:
+            if self.statistics is not None:
+                self.statistics.add_error()
+            self.logger.error(f"end_cycle failed: {e}")
+        return result
+
+    async def _maybe_truncate_wal(self, frames: int, done: int):
+        """
+        PASSIVE не перезапускает WAL, пока читатели держат старые снимки, и
+        файл растёт при постоянной записи. TRUNCATE дожидается читателей
+        (busy_timeout) и обнуляет файл; до journal_size_limit его сожмёт и
+        следующий перезапуск WAL.
+        """
+        now = time.monotonic()
+        if frames < self.truncate_pages and now - self._last_truncate < self.checkpoint_interval:
+            return
+        self._last_truncate = now
+        start = time.perf_counter()
+        busy, _, _ = await wal_checkpoint(self._conn, "TRUNCATE")
+        elapsed = time.perf_counter() - start
+        if self.statistics is not None:
+            self.statistics.add_stage_time("wal_truncate", elapsed)
+        if busy:
+            self.logger.warning(f"WAL TRUNCATE checkpoint blocked by readers ({frames} frames, "
+                                f"{done} checkpointed)")
+        else:
+            self.logger.info(f"WAL truncated: {frames} frames in {elapsed:.3f}s")
+
+    async def _maintain(self, raw_days: int, hourly_days: int, daily_days: int,
+                        events_max_age_days: int) -> dict:
+        start = time.perf_counter()
+        removed = {}
+        try:
+            removed = await downsample_price_history(self._conn, raw_days, hourly_days, daily_days)
+            removed["events"] = await prune_events(self._conn, events_max_age_days)
+        except Exception as e:
+            if self.statistics is not None:
+                self.statistics.add_error()
+            self.logger.error(f"DB maintenance failed: {e}")
+            return removed
+        elapsed = time.perf_counter() - start
+        self.logger.info(f"DB maintenance: removed {removed} in {elapsed:.2f}s")
+        return removed
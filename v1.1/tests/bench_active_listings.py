@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Бенчмарк floor/top-N по активным листингам на таблице nft_offers из N строк:
+проход по покрывающему индексу idx_active_listings (_ACTIVE_LISTINGS) против
+прежнего запроса с сортировкой всей таблицы по sale_price + sale_fee.
+
+    python tests/bench_active_listings.py [строк] [повторов]
+"""
+
+import asyncio
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import aiosqlite
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from storage.db import _ACTIVE_LISTINGS, init_tables
+
+# Запрос до idx_active_listings (get_offers_for_notifications)
+LEGACY = """
+  SELECT token_address, sale_price + sale_fee
+    FROM nft_offers NOT INDEXED
+   WHERE sale_price IS NOT NULL AND is_active = 1
+   ORDER BY sale_price + sale_fee ASC
+"""
+
+async def populate(path: Path, rows: int):
+    rnd = random.Random(1)
+    conn = await aiosqlite.connect(path)
+    await init_tables(conn)
+    await conn.executemany(
+        "INSERT INTO nft_offers (token_address, sale_price, sale_fee, is_active, royalty_amount) "
+        "VALUES (?, ?, ?, ?, ?)",
+        [(f"EQ{i:046d}", rnd.randrange(10**9, 10**12), rnd.choice((None, 10**7)),
+          int(rnd.random() > 0.2), rnd.randrange(10**8)) for i in range(rows)]
+    )
+    await conn.commit()
+    await conn.execute("ANALYZE")
+    await conn.close()
+
+def bench(conn, sql: str, params: tuple, repeat: int) -> float:
+    """Среднее время запроса, мс."""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        conn.execute(sql, params).fetchall()
+    return (time.perf_counter() - start) / repeat * 1000
+
+if __name__ == "__main__":
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "bench.db"
+        asyncio.run(populate(path, rows))
+        conn = sqlite3.connect(path)
+        print(f"{rows} rows, SQLite {sqlite3.sqlite_version}")
+        for label, suffix, params in (("top-5", " LIMIT ?", (5,)), ("all active", "", ())):
+            new = bench(conn, _ACTIVE_LISTINGS + suffix, params, repeat)
+            old = bench(conn, LEGACY + suffix, params, repeat)
+            print(f"{label:>10}: index {new:8.3f} ms, full sort {old:8.3f} ms ({old / new:.1f}x)")
+        conn.close()
@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Микробенчмарк разбора страницы деталей на корпусе tests/fixtures/pages:
+быстрый путь (parse_details) против BeautifulSoup + json.loads.
+
+    python tests/bench_detail_parser.py [повторов]
+"""
+
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from test_detail_parser import PAGES, reference_details
+from core.detail_parser import parse_details
+
+def bench(fn, pages: list, repeat: int) -> float:
+    """Среднее время на страницу, мс."""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for raw in pages:
+            fn(raw)
+    return (time.perf_counter() - start) / (repeat * len(pages)) * 1000
+
+if __name__ == "__main__":
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    pages = [p.read_bytes() for p in sorted(PAGES.glob("*.html"))]
+    fast = bench(parse_details, pages, repeat)
+    soup = bench(reference_details, pages, repeat)
+    print(f"{len(pages)} pages, {sum(map(len, pages)) // 1024} KiB")
+    print(f"fast path:     {fast:.3f} ms/page")
+    print(f"BeautifulSoup: {soup:.3f} ms/page ({soup / fast:.1f}x)")
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Микробенчмарк выборки gqlCache из __NEXT_DATA__ на корпусе tests/fixtures/pages:
+select_gql_cache против полного json.loads — время и пик выделенной памяти
+(tracemalloc) на страницу.
+
+    python tests/bench_next_data.py [повторов]
+"""
+
+import json
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from test_detail_parser import PAGES
+from core.next_data import extract_next_data, select_gql_cache
+
+def full_decode(payload: bytes) -> dict:
+    return json.loads(payload)["props"]["pageProps"]["gqlCache"]
+
+def bench(fn, payloads: list, repeat: int) -> float:
+    """Среднее время на страницу, мс."""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for payload in payloads:
+            fn(payload)
+    return (time.perf_counter() - start) / (repeat * len(payloads)) * 1000
+
+def peak(fn, payload: bytes) -> int:
+    """Пик памяти, выделенной за один вызов, байт."""
+    tracemalloc.start()
+    try:
+        fn(payload)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+if __name__ == "__main__":
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    payloads = {}
+    for path in sorted(PAGES.glob("*.html")):
+        payload = extract_next_data(path.read_bytes())
+        if payload is not None:
+            payloads[path.stem] = payload
+    print(f"{len(payloads)} payloads, {sum(map(len, payloads.values())) // 1024} KiB")
+    for name, payload in payloads.items():
+        print(f"{name:>24}: {len(payload) // 1024:4d} KiB, peak "
+              f"select {peak(select_gql_cache, payload) / 1024:7.1f} KiB, "
+              f"json.loads {peak(full_decode, payload) / 1024:7.1f} KiB")
+    fast = bench(select_gql_cache, list(payloads.values()), repeat)
+    full = bench(full_decode, list(payloads.values()), repeat)
+    print(f"select_gql_cache: {fast:.3f} ms/page")
+    print(f"json.loads:       {full:.3f} ms/page ({full / fast:.1f}x)")
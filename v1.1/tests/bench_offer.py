@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Бенчмарк записи оффера: Offer (__slots__, цены — целые нанотоны) против
+прежних словарей с ценами float TON. Меряются время разбора N узлов
+листинга (parse_list_data) и память на полную запись — поля листинга вместе
+с деталями продажи (tracemalloc).
+
+Импорт core.async_stream_parser читает профиль prod, поэтому запускать из
+каталога с config.yaml:
+
+    python tests/bench_offer.py [узлов] [повторов]
+"""
+
+import random
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from core.async_stream_parser import parse_list_data
+from core.graphql_details import details_from_gql_sale
+
+def parse_list_data_dict(node: dict) -> dict:
+    """Прежний parse_list_data: словарь, цены float TON."""
+    sale      = node.get("sale")     or {}
+    max_offer = node.get("maxOffer") or {}
+    stats     = node.get("stats")    or {}
+    now = datetime.utcnow().isoformat()
+    return {
+        "token_address":     node.get("address"),
+        "phone_number":      node.get("name"),
+        "sale_contract":     sale.get("address"),
+        "sale_price":        float(sale.get("fullPrice", 0))  / 1e9 if sale.get("fullPrice") else None,
+        "sale_fee":          float(sale.get("networkFee", 0)) / 1e9 if sale.get("networkFee") else None,
+        "max_offer_price":   float(max_offer.get("profitPrice", 0)) / 1e9 if max_offer.get("profitPrice") else None,
+        "prev_owners_count": stats.get("prevOwnersCount"),
+        "owner_address":     node.get("ownerAddress") or "",
+        "updated_at":        now,
+        "created_at":        now,
+    }
+
+def details_dict(sale: dict) -> dict:
+    """Прежние детали продажи: цены float TON."""
+    return {
+        "royalties_address": sale.get("royaltyAddress"),
+        "royalty_amount":    float(sale["royaltyAmount"]) / 1e9 if sale.get("royaltyAmount") else None,
+        "fee_total":         float(sale["marketplaceFee"]) / 1e9 if sale.get("marketplaceFee") else None,
+        "sale_type":         sale.get("__typename"),
+        "nft_address":       sale.get("address"),
+    }
+
+def make_nodes(n: int, rnd: random.Random) -> list:
+    return [{
+        "address": f"EQ{i:046d}",
+        "name": f"+888 {i:04d} {rnd.randrange(10**4):04d}",
+        "ownerAddress": f"EQowner{i:041d}",
+        "sale": {"address": f"EQsale{i:042d}", "fullPrice": str(rnd.randrange(10**9, 10**13)),
+                 "networkFee": "10000000"},
+        "maxOffer": {"profitPrice": str(rnd.randrange(10**9, 10**12))},
+        "stats": {"prevOwnersCount": rnd.randrange(10)},
+    } for i in range(n)]
+
+def make_sales(n: int, rnd: random.Random) -> list:
+    return [{"__typename": "NftSaleFixPrice", "address": f"EQnft{i:043d}", "royaltyAddress": "EQroyalty",
+             "royaltyAmount": str(rnd.randrange(10**10)), "marketplaceFee": str(rnd.randrange(10**9))}
+            for i in range(n)]
+
+def old_record(node: dict, sale: dict) -> dict:
+    rec = parse_list_data_dict(node)
+    rec.update(details_dict(sale))
+    return rec
+
+def new_record(node: dict, sale: dict):
+    details = details_from_gql_sale(sale)
+    details["nft_address"] = sale.get("address")
+    return parse_list_data(node).with_details(details)
+
+def parse_time(fn, nodes: list, repeat: int) -> float:
+    """Лучшее время разбора всех узлов, мс."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for node in nodes:
+            fn(node)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+def bytes_per_record(fn, nodes: list, sales: list) -> float:
+    """Память, занятая удерживаемыми записями, байт на запись."""
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        records = [fn(node, sale) for node, sale in zip(nodes, sales)]
+        used = tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+    # Список ссылок не относится к записям
+    return (used - sys.getsizeof(records)) / len(records)
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    rnd = random.Random(1)
+    nodes, sales = make_nodes(n, rnd), make_sales(n, rnd)
+    new_ms = parse_time(parse_list_data, nodes, repeat)
+    old_ms = parse_time(parse_list_data_dict, nodes, repeat)
+    new_b = bytes_per_record(new_record, nodes, sales)
+    old_b = bytes_per_record(old_record, nodes, sales)
+    print(f"{n} edges")
+    print(f"parse_list_data: Offer {new_ms:7.2f} ms, dict {old_ms:7.2f} ms ({old_ms / new_ms:.1f}x)")
+    print(f"full record:     Offer {new_b:7.0f} B,  dict {old_b:7.0f} B ({old_b / new_b:.1f}x)")
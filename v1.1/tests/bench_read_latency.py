@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Бенчмарк задержки чтения под постоянной записью: floor-запрос
+(get_active_listings, top-5) на соединении-писателе, как было до
+ConnectionManager, против соединения только для чтения из пула. Фоновая
+задача всё время пишет пачки upsert_offers через писателя.
+
+    python tests/bench_read_latency.py [офферов] [запросов]
+"""
+
+import asyncio
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from core.offer import Offer
+from storage.connections import ConnectionManager
+from storage.db import get_active_listings, init_tables, upsert_offers
+
+BATCH = 200
+
+def make_offers(n: int, rnd: random.Random) -> list:
+    return [Offer(f"EQ{i:046d}", sale_price=rnd.randrange(10**9, 10**12), sale_fee=10**7)
+            for i in range(n)]
+
+async def write_load(manager: ConnectionManager, offers: list, stop: asyncio.Event, rnd: random.Random):
+    """Пачки по BATCH офферов с новыми ценами, без пауз, до stop."""
+    while not stop.is_set():
+        batch = rnd.sample(offers, BATCH)
+        for rec in batch:
+            rec.sale_price = rnd.randrange(10**9, 10**12)
+        await upsert_offers(manager.writer, batch)
+        await asyncio.sleep(0)
+
+async def measure(manager: ConnectionManager, shared: bool, queries: int) -> list:
+    """Задержки floor-запроса, мс."""
+    latencies = []
+    for _ in range(queries):
+        start = time.perf_counter()
+        if shared:
+            await get_active_listings(manager.writer, 5)
+        else:
+            async with manager.read() as conn:
+                await get_active_listings(conn, 5)
+        latencies.append((time.perf_counter() - start) * 1000)
+        await asyncio.sleep(0.005)
+    return latencies
+
+def summary(latencies: list) -> str:
+    q = statistics.quantiles(latencies, n=100)
+    return f"p50 {q[49]:7.2f} ms, p99 {q[98]:7.2f} ms, max {max(latencies):7.2f} ms"
+
+async def main(n: int, queries: int):
+    rnd = random.Random(1)
+    with tempfile.TemporaryDirectory() as tmp:
+        manager = ConnectionManager(str(Path(tmp) / "bench.db"))
+        await manager.open()
+        await init_tables(manager.writer)
+        offers = make_offers(n, rnd)
+        for i in range(0, n, 1000):
+            await upsert_offers(manager.writer, offers[i:i + 1000])
+        print(f"{n} offers, write batches of {BATCH}")
+        for label, shared in (("writer connection", True), ("read-only pool", False)):
+            stop = asyncio.Event()
+            writer = asyncio.create_task(write_load(manager, offers, stop, rnd))
+            latencies = await measure(manager, shared, queries)
+            stop.set()
+            await writer
+            print(f"{label:>18}: {summary(latencies)}")
+        await manager.close()
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+    queries = int(sys.argv[2]) if len(sys.argv) > 2 else 300
+    asyncio.run(main(n, queries))
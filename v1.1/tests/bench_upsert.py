@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Бенчмарк записи офферов: пакетный upsert_offers (executemany, одна транзакция
+на пачку) против прежнего построчного пути — BEGIN IMMEDIATE, SELECT, UPDATE
+или INSERT и commit на каждый оффер. Построчный путь воспроизведён здесь же
+(upsert_offer_per_row), в storage.db его больше нет. Для каждого размера
+меряются вставка новых офферов и перезапись тех же офферов с новой ценой.
+
+    python tests/bench_upsert.py [размер ...] [--batch N]
+"""
+
+import asyncio
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from core.offer import Offer
+from storage.db import get_connection, init_tables, upsert_offers
+
+async def upsert_offer_per_row(conn, rec: Offer):
+    """Прежний upsert_offer: транзакция и коммит на каждый оффер."""
+    data = rec.to_row()
+    token = data["token_address"]
+    now = datetime.utcnow().isoformat()
+    data["updated_at"] = now
+    try:
+        await conn.execute("BEGIN IMMEDIATE")
+        cursor = await conn.execute("SELECT created_at FROM nft_offers WHERE token_address = ?", (token,))
+        row = await cursor.fetchone()
+        if row:
+            data["created_at"] = row[0]
+            set_clause = ", ".join(f"{f}=?" for f in data)
+            await conn.execute(f"UPDATE nft_offers SET {set_clause} WHERE token_address = ?",
+                               list(data.values()) + [token])
+        else:
+            data["created_at"] = now
+            await conn.execute(
+                f"INSERT INTO nft_offers ({', '.join(data)}) VALUES ({', '.join('?' for _ in data)})",
+                list(data.values())
+            )
+        await conn.commit()
+    except Exception as e:
+        await conn.rollback()
+        raise e
+
+def make_offers(n: int, rnd: random.Random) -> list:
+    return [
+        Offer(f"EQ{i:046d}", phone_number=f"+888 {i:08d}", sale_price=rnd.randrange(10**9, 10**12),
+              sale_fee=10**7, owner_address=f"EQowner{i % 1000}", royalties_address="EQroyalty",
+              royalty_amount=10**8, fee_total=5 * 10**7, sale_type="NftSaleFixPrice")
+        for i in range(n)
+    ]
+
+async def per_row(conn, offers: list, batch: int):
+    for rec in offers:
+        await upsert_offer_per_row(conn, rec)
+
+async def batched(conn, offers: list, batch: int):
+    for i in range(0, len(offers), batch):
+        await upsert_offers(conn, offers[i:i + batch])
+
+async def run(path: Path, fn, n: int, batch: int) -> tuple:
+    """rows/s для вставки n новых офферов и для перезаписи их же с новой ценой."""
+    rnd = random.Random(n)
+    conn = await get_connection(str(path))
+    await init_tables(conn)
+    offers = make_offers(n, rnd)
+    start = time.perf_counter()
+    await fn(conn, offers, batch)
+    insert = n / (time.perf_counter() - start)
+    for rec in offers:
+        rec.sale_price += 1
+    start = time.perf_counter()
+    await fn(conn, offers, batch)
+    update = n / (time.perf_counter() - start)
+    await conn.close()
+    return insert, update
+
+async def main(sizes: list, batch: int):
+    print(f"batch size {batch}")
+    for n in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            old = await run(Path(tmp) / "per_row.db", per_row, n, batch)
+            new = await run(Path(tmp) / "batched.db", batched, n, batch)
+        print(f"{n:>7} offers: insert {new[0]:9.0f} vs {old[0]:7.0f} rows/s ({new[0] / old[0]:5.1f}x), "
+              f"update {new[1]:9.0f} vs {old[1]:7.0f} rows/s ({new[1] / old[1]:5.1f}x)")
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    batch = 200
+    if "--batch" in args:
+        i = args.index("--batch")
+        batch = int(args[i + 1])
+        del args[i:i + 2]
+    asyncio.run(main([int(a) for a in args] or [1_000, 10_000, 100_000], batch))
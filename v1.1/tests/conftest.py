@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# Модули проекта импортируются как core.*, storage.*, utils.*
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -0,0 +1,80 @@
+import asyncio
+import sqlite3
+
+import aiosqlite
+
+from storage.db import _ACTIVE_LISTINGS, init_tables, mark_seen_offers
+
+def _plan(path, sql: str, params=()) -> list:
+    conn = sqlite3.connect(path)
+    try:
+        return [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params)]
+    finally:
+        conn.close()
+
+async def _init(path):
+    conn = await aiosqlite.connect(path)
+    await init_tables(conn)
+    await conn.executemany(
+        "INSERT INTO nft_offers (token_address, sale_price, sale_fee, is_active) VALUES (?, ?, ?, ?)",
+        [(f"t{i}", 10**9 + i, None if i % 3 else 10**7, int(i % 5 != 0)) for i in range(1000)]
+    )
+    await conn.commit()
+    await conn.execute("ANALYZE")
+    await conn.close()
+
+def test_active_listings_plan_uses_covering_index(tmp_path):
+    path = tmp_path / "plan.db"
+    asyncio.run(_init(path))
+    for sql, params in ((_ACTIVE_LISTINGS, ()), (_ACTIVE_LISTINGS + " LIMIT ?", (5,))):
+        plan = _plan(path, sql, params)
+        assert plan == ["SCAN nft_offers USING COVERING INDEX idx_active_listings"], plan
+
+def test_stale_active_listings_index_rebuilt(tmp_path):
+    path = tmp_path / "stale.db"
+    asyncio.run(_init(path))
+    conn = sqlite3.connect(path)
+    conn.execute("DROP INDEX idx_active_listings")
+    # БД прежней схемы: генерируемая колонка effective_price и индекс по ней
+    conn.execute("""
+      ALTER TABLE nft_offers ADD COLUMN effective_price INTEGER
+        GENERATED ALWAYS AS (sale_price + COALESCE(sale_fee, 0)) VIRTUAL
+    """)
+    conn.execute("""
+      CREATE INDEX idx_active_listings ON nft_offers(effective_price, token_address, sale_price)
+       WHERE sale_price IS NOT NULL AND is_active = 1
+    """)
+    conn.commit()
+    conn.close()
+
+    async def reinit():
+        conn = await aiosqlite.connect(path)
+        await init_tables(conn)
+        await conn.close()
+
+    asyncio.run(reinit())
+    assert _plan(path, _ACTIVE_LISTINGS) == ["SCAN nft_offers USING COVERING INDEX idx_active_listings"]
+    conn = sqlite3.connect(path)
+    columns = [row[1] for row in conn.execute("PRAGMA table_xinfo(nft_offers)")]
+    conn.close()
+    assert "effective_price" not in columns
+
+def test_truncated_listing_delists_below_max_price(tmp_path):
+    async def run():
+        conn = await aiosqlite.connect(tmp_path / "delist.db")
+        await init_tables(conn)
+        await conn.executemany(
+            "INSERT INTO nft_offers (token_address, sale_price, is_active) VALUES (?, ?, 1)",
+            [("sold", 1), ("seen", 2), ("tie", 3), ("above", 5)]
+        )
+        await conn.commit()
+        # Прочитана только первая страница: seen по 2 и что-то по 3
+        delisted = await mark_seen_offers(conn, ["seen", "other"], delist_unseen=True, max_price=3)
+        cursor = await conn.execute("SELECT token_address FROM nft_offers WHERE is_active = 1 ORDER BY 1")
+        active = [r[0] for r in await cursor.fetchall()]
+        await conn.close()
+        return delisted, active
+
+    delisted, active = asyncio.run(run())
+    assert delisted == ["sold"]
+    assert active == ["above", "seen", "tie"]
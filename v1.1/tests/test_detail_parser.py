@@ -0,0 +1,35 @@
+import json
+from pathlib import Path
+
+import pytest
+from bs4 import BeautifulSoup
+
+from core.detail_parser import details_from_gql_cache, parse_details
+from core.next_data import extract_next_data, select_gql_cache
+
+PAGES = Path(__file__).parent / "fixtures" / "pages"
+
+def reference_details(html: bytes):
+    """Исходный путь: дерево BeautifulSoup и полный json.loads."""
+    soup = BeautifulSoup(html, "html.parser")
+    script = soup.find("script", id="__NEXT_DATA__")
+    if not script or not script.string:
+        return None
+    gql = json.loads(script.string)
+    return details_from_gql_cache(gql.get("props", {}).get("pageProps", {}).get("gqlCache", {}))
+
+@pytest.mark.parametrize("page", sorted(p.name for p in PAGES.glob("*.html")))
+def test_fast_path_matches_soup(page):
+    raw = (PAGES / page).read_bytes()
+    details, _ = parse_details(raw)
+    assert details == reference_details(raw)
+
+@pytest.mark.parametrize("page", sorted(p.name for p in PAGES.glob("*.html") if p.name != "no_next_data.html"))
+def test_fast_path_used(page):
+    payload = extract_next_data((PAGES / page).read_bytes())
+    assert payload is not None
+    assert select_gql_cache(payload) is not None
+
+def test_str_input():
+    raw = (PAGES / "fix_price.html").read_bytes()
+    assert parse_details(raw.decode("utf-8"))[0] == parse_details(raw)[0]
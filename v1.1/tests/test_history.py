@@ -0,0 +1,50 @@
+import asyncio
+from datetime import datetime
+
+import aiosqlite
+
+from storage.db import init_tables
+from storage.history import downsample_price_history, get_floor_history
+
+async def _floor_series(tmp_path, rollup: bool):
+    conn = await aiosqlite.connect(tmp_path / "history.db")
+    await init_tables(conn)
+
+    async def listing(token, price, fee, ts):
+        await conn.execute("""
+          INSERT INTO nft_offers (token_address, sale_price, sale_fee, is_active, updated_at, created_at)
+          VALUES (?, ?, ?, 1, ?, ?)
+          ON CONFLICT(token_address) DO UPDATE SET
+            sale_price = excluded.sale_price, sale_fee = excluded.sale_fee,
+            is_active = 1, updated_at = excluded.updated_at
+        """, (token, price, fee, ts, ts))
+
+    await listing("A", 10, 1, "2024-01-01T00:10:00")
+    await listing("B", 20, None, "2024-01-01T00:20:00")
+    # 01:00 — без изменений; 02:30 — A снят с продажи
+    await conn.execute("UPDATE nft_offers SET is_active = 0, delisted_at = ? WHERE token_address = 'A'",
+                       ("2024-01-01T02:30:00",))
+    # 03:00 — B дешевеет только за счёт комиссии
+    await listing("B", 18, 1, "2024-01-01T03:15:00")
+    await conn.commit()
+    if rollup:
+        await downsample_price_history(conn, 1, 30, 0, now=datetime(2024, 1, 5))
+        cursor = await conn.execute("SELECT COUNT(*) FROM offer_price_history")
+        assert (await cursor.fetchone())[0] == 0
+    series = await get_floor_history(conn, "2024-01-01T00:00:00", "2024-01-01T05:00:00")
+    await conn.close()
+    return series
+
+EXPECTED = [
+    ("2024-01-01T00:00:00", 11),
+    ("2024-01-01T01:00:00", 11),
+    ("2024-01-01T02:00:00", 11),
+    ("2024-01-01T03:00:00", 19),
+    ("2024-01-01T04:00:00", 19),
+]
+
+def test_floor_from_raw_history(tmp_path):
+    assert asyncio.run(_floor_series(tmp_path, rollup=False)) == EXPECTED
+
+def test_floor_from_rollups(tmp_path):
+    assert asyncio.run(_floor_series(tmp_path, rollup=True)) == EXPECTED
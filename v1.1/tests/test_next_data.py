@@ -0,0 +1,77 @@
+import json
+
+import pytest
+
+from core.detail_parser import details_from_gql_cache
+from core.next_data import select_gql_cache
+
+SALE = {
+    "__typename": "NftSaleFixPrice",
+    "royaltyAddress": "EQRoyalty",
+    "royaltyAmount": "100000000",
+    "marketplaceFee": "5000000",
+}
+
+def next_data(cache: dict, **extra) -> str:
+    return json.dumps({"props": {"pageProps": {"gqlCache": cache, **extra}}, "page": "/nft"})
+
+def full_cache(payload: str) -> dict:
+    return json.loads(payload)["props"]["pageProps"]["gqlCache"]
+
+PAYLOADS = {
+    "sale": next_data({
+        "ROOT_QUERY": {"nft({\"address\":\"T\"})": {"__ref": "NftItem:T"}},
+        "NftItem:T": {"address": "EQItem", "sale": {"__ref": "NftSaleFixPrice:S"}},
+        "NftSaleFixPrice:S": SALE,
+    }),
+    # Вложенная запись Nft*-типа после настоящей не должна её перезаписать
+    "nested_sale": next_data({
+        "NftSaleFixPrice:S": SALE,
+        "NftCollection:C": {"lastSale": {"NftSaleFixPrice": {"royaltyAddress": "EQOther"}}},
+    }),
+    "nested_item_first": next_data({
+        "NftCollection:C": {"items": [{"NftItem:X": {"address": "EQWrong"}}]},
+        "NftItem:T": {"address": "EQItem"},
+    }),
+    # Ключи внутри строк, экранированные кавычки и скобки
+    "strings": next_data({
+        "Meta:1": {"description": "x\", \"NftSaleFixPrice:Z\": {\"royaltyAddress\": \"EQFake\"} }"},
+        "Meta:2": ["{[", "]}", "\\\""],
+        "NftSaleAuction:A": {**SALE, "__typename": "NftSaleAuction"},
+    }),
+    "after_cache": next_data(
+        {"NftItem:T": {"address": "EQItem"}},
+        tail={"NftSaleFixPrice:Z": {"royaltyAddress": "EQTail"}},
+    ),
+    # Вложенность глубже развёрнутого шаблона и скалярные значения записей
+    "deep_and_scalars": next_data({
+        "Meta:1": {"a": {"b": {"c": {"d": [{"e": "}]"}, [[[-1.5e3]]]]}}}},
+        "Count:1": 5,
+        "Flag:1": True,
+        "Null:1": None,
+        "NftSaleFixPrice:S": SALE,
+    }),
+    "no_sale": next_data({"NftItem:T": {"address": "EQItem", "sale": None}, "Empty:1": {}}),
+}
+
+@pytest.mark.parametrize("name", sorted(PAYLOADS))
+def test_select_matches_full_parse(name):
+    payload = PAYLOADS[name]
+    selected = select_gql_cache(payload.encode())
+    expected = details_from_gql_cache(full_cache(payload))
+    assert selected is not None
+    assert details_from_gql_cache(selected) == expected
+
+def test_nested_sale_ignored():
+    selected = select_gql_cache(PAYLOADS["nested_sale"])
+    assert list(selected) == ["NftSaleFixPrice:S"]
+    assert details_from_gql_cache(selected)["royalties_address"] == "EQRoyalty"
+
+@pytest.mark.parametrize("payload", [
+    next_data({"Meta:1": {"a": 1}}),
+    next_data({}),
+    '{"props": {"pageProps": {"gqlCache": {"NftItem:T": {"address": ',
+    "not json",
+])
+def test_select_falls_back(payload):
+    assert select_gql_cache(payload) is None
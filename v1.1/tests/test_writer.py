@@ -0,0 +1,37 @@
+import asyncio
+import logging
+
+import aiosqlite
+import pytest
+
+from core.offer import Offer
+from storage.writer import OfferWriter
+
+async def _count_offers(conn) -> int:
+    cursor = await conn.execute("SELECT COUNT(*) FROM nft_offers")
+    return (await cursor.fetchone())[0]
+
+async def _fail(conn):
+    raise RuntimeError("boom")
+
+async def _run(path):
+    conn = await aiosqlite.connect(path)
+    writer = OfferWriter(conn, batch_size=100, flush_interval=60, queue_size=100,
+                         logger=logging.getLogger("test"))
+    await writer.start()
+    try:
+        await writer.put(Offer("t1", sale_price=10**9))
+        # execute идёт после уже поставленных записей: пачка сбрасывается до fn
+        seen = await writer.execute(_count_offers)
+        with pytest.raises(RuntimeError):
+            await writer.execute(_fail)
+        # Ошибка fn не останавливает писателя
+        await writer.put(Offer("t2", sale_price=2 * 10**9))
+        after = await writer.execute(_count_offers)
+    finally:
+        await writer.close()
+        await conn.close()
+    return seen, after
+
+def test_execute_runs_on_writer_in_order(tmp_path):
+    assert asyncio.run(_run(tmp_path / "writer.db")) == (1, 2)
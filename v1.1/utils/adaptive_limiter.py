@@ -0,0 +1,87 @@
+# utils/adaptive_limiter.py
+
+import asyncio
+import time
+
+class AdaptiveLimiter:
+    """
+    Адаптивный лимит параллельных запросов (AIMD). Каждый успешный ответ с
+    нормальной задержкой добавляет 1/limit, так что за «окно» из limit
+    запросов лимит растёт на единицу. 429/403/5xx и таймауты уменьшают лимит
+    в backoff раз, задержка выше latency_tolerance × базовой — в
+    latency_backoff раз. Снижение — не чаще раза в cooldown секунд, чтобы
+    пачка ошибок от уже запущенных запросов не обнулила лимит.
+
+    Используется вместо asyncio.Semaphore: ``async with limiter: ...``.
+    """
+
+    def __init__(self, initial: int, min_limit: int, max_limit: int,
+                 backoff: float = 0.5, latency_backoff: float = 0.9,
+                 latency_tolerance: float = 2.0, cooldown: float = 1.0,
+                 statistics=None):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff = backoff
+        self.latency_backoff = latency_backoff
+        self.latency_tolerance = latency_tolerance
+        self.cooldown = cooldown
+        self.statistics = statistics
+        self._limit = float(min(max(initial, min_limit), max_limit))
+        self._in_flight = 0
+        self._cond = asyncio.Condition()
+        self._base_latency = None
+        self._last_decrease = 0.0
+        self._publish()
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    async def __aenter__(self):
+        async with self._cond:
+            await self._cond.wait_for(lambda: self._in_flight < self.limit)
+            self._in_flight += 1
+        return self
+
+    async def __aexit__(self, *exc):
+        async with self._cond:
+            self._in_flight -= 1
+            self._cond.notify_all()
+
+    def on_success(self, latency: float):
+        if self._base_latency is None or latency < self._base_latency:
+            self._base_latency = latency
+        else:
+            # Медленный дрейф базы вверх: сеть могла стать медленнее насовсем
+            self._base_latency += (latency - self._base_latency) * 0.01
+        if latency > self._base_latency * self.latency_tolerance:
+            self._decrease(self.latency_backoff)
+            return
+        old = self.limit
+        self._limit = min(self.max_limit, self._limit + 1.0 / self._limit)
+        if self.limit > old:
+            self._publish()
+            self._wake()
+
+    def on_overload(self):
+        """429/403/5xx или таймаут."""
+        self._decrease(self.backoff)
+
+    def _decrease(self, factor: float):
+        now = time.monotonic()
+        if now - self._last_decrease < self.cooldown:
+            return
+        self._last_decrease = now
+        self._limit = max(self.min_limit, self._limit * factor)
+        self._publish()
+
+    def _wake(self):
+        # Лимит вырос — ожидающие могут пройти, не дожидаясь освобождения слота
+        async def notify():
+            async with self._cond:
+                self._cond.notify_all()
+        asyncio.get_running_loop().create_task(notify())
+
+    def _publish(self):
+        if self.statistics is not None:
+            self.statistics.set_concurrency_limit(self.limit)
@@ -1,13 +1,17 @@
 # utils/async_session.py
 
 import random
+import time
 import asyncio  # добавлено для TimeoutError
 import aiohttp
 from aiohttp_retry import RetryClient, ExponentialRetry
 from aiohttp_proxy import ProxyConnector
 from utils.config import load_config
+from utils.rate_limiter import RateLimiter
 
 cfg = load_config("prod")
+# Общий для всех сессий процесса лимит запросов по хостам
+rate_limiter = RateLimiter(cfg["rate_limits"])
 
 class AsyncSession:
     def __init__(self):
@@ -48,6 +52,11 @@ class AsyncSession:
         headers = kwargs.pop("headers", {})
         headers.setdefault("User-Agent", random.choice(cfg["user_agents"]))
         proxy = kwargs.pop("proxy", None)
+        timing = kwargs.pop("timing", None)
+        await rate_limiter.acquire(url)
+        if timing is not None:
+            # Отсчёт после ожидания лимита: задержка запроса без локальной очереди
+            timing["start"] = time.perf_counter()
         return await self._client.get(url, headers=headers, proxy=proxy)
 
     async def post(self, url: str, **kwargs) -> aiohttp.ClientResponse:
@@ -55,6 +64,11 @@ class AsyncSession:
         headers.setdefault("User-Agent", random.choice(cfg["user_agents"]))
         json_body = kwargs.pop("json", None)
         proxy = kwargs.pop("proxy", None)
+        timing = kwargs.pop("timing", None)
+        await rate_limiter.acquire(url)
+        if timing is not None:
+            # Отсчёт после ожидания лимита: задержка запроса без локальной очереди
+            timing["start"] = time.perf_counter()
         return await self._client.post(url, headers=headers, json=json_body, proxy=proxy)
 
     async def close(self):
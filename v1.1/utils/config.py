@@ -3,6 +3,7 @@
 import os
 import yaml
 import json
+from urllib.parse import urlparse
 
 class ConfigError(Exception):
     pass
@@ -50,9 +51,66 @@ def load_config(profile: str, path: str = None) -> dict:
         cfg["request_delay_max"] = float(cfg.get("request_delay_max", 3.0))
         cfg["retry_total"]       = int(cfg.get("retry_total", 3))
         cfg["retry_backoff_factor"] = float(cfg.get("retry_backoff_factor", 1))
+        cfg["list_paginate"]     = bool(cfg.get("list_paginate", False))
+        cfg["list_max_pages"]    = int(cfg.get("list_max_pages", 0))
+        cfg["detail_cache_ttl"]  = float(cfg.get("detail_cache_ttl", 3600))
+        cfg["detail_cache_size"] = int(cfg.get("detail_cache_size", 10000))
+        cfg["detail_batch_size"] = int(cfg.get("detail_batch_size", 50))
+        cfg["detail_batch_window"] = float(cfg.get("detail_batch_window", 0.05))
+        cfg["parse_workers"]     = int(cfg.get("parse_workers", 0))
+        cfg["trash_count"]       = int(cfg.get("trash_count", 5))
+        cfg["db_batch_size"]     = max(1, int(cfg.get("db_batch_size", 200)))
+        cfg["db_flush_interval"] = float(cfg.get("db_flush_interval", 1.0))
+        cfg["db_queue_size"]     = max(1, int(cfg.get("db_queue_size", 10000)))
+        cfg["db_read_connections"] = max(1, int(cfg.get("db_read_connections", 2)))
+        cfg["db_read_mmap_mb"]   = int(cfg.get("db_read_mmap_mb", 256))
+        cfg["db_read_cache_mb"]  = int(cfg.get("db_read_cache_mb", 64))
+        cfg["wal_size_limit_mb"] = int(cfg.get("wal_size_limit_mb", 64))
+        cfg["wal_checkpoint_interval"] = float(cfg.get("wal_checkpoint_interval", 300))
+        cfg["wal_truncate_pages"] = int(cfg.get("wal_truncate_pages", 10000))
+        cfg["history_raw_days"]    = int(cfg.get("history_raw_days", 7))
+        cfg["history_hourly_days"] = int(cfg.get("history_hourly_days", 90))
+        cfg["history_daily_days"]  = int(cfg.get("history_daily_days", 0))
+        cfg["events_max_age_days"] = int(cfg.get("events_max_age_days", 30))
+        cfg["history_maintenance_interval"] = float(cfg.get("history_maintenance_interval", 3600))
+        cfg["telegram_concurrency"] = max(1, int(cfg.get("telegram_concurrency", 20)))
+        cfg["telegram_chat_rps"]  = float(cfg.get("telegram_chat_rps", 1.0))
+        cfg["telegram_max_retries"] = int(cfg.get("telegram_max_retries", 3))
+        # Long polling держит запрос telegram_poll_timeout секунд: таймаут
+        # чтения сессии (sock_read) должен быть больше с запасом, иначе
+        # каждый getUpdates обрывается и уходит в ретраи
+        sock_read = float(cfg.get("sock_read_timeout", cfg["read_timeout"]))
+        max_poll = max(0, int(sock_read) - 5)
+        cfg["telegram_poll_timeout"] = int(cfg.get("telegram_poll_timeout", min(25, max_poll)))
+        if not 0 <= cfg["telegram_poll_timeout"] <= max_poll:
+            raise ConfigError(
+                f"telegram_poll_timeout должен быть от 0 до {max_poll} "
+                f"(sock_read_timeout/read_timeout {sock_read:g}с минус 5с)"
+            )
+        cfg["outbox_retry_base"]  = float(cfg.get("outbox_retry_base", 30))
+        cfg["outbox_max_attempts"] = max(1, int(cfg.get("outbox_max_attempts", 5)))
+        cfg["outbox_ttl_hours"]   = float(cfg.get("outbox_ttl_hours", 168))
+        cfg["alert_digest_window"] = max(0.0, float(cfg.get("alert_digest_window", 3.0)))
+        cfg["alert_urgent_delay"] = max(0.0, float(cfg.get("alert_urgent_delay", 0.0)))
+        cfg["adaptive_concurrency"] = bool(cfg.get("adaptive_concurrency", False))
+        cfg["concurrency_min"]   = max(1, int(cfg.get("concurrency_min", 1)))
+        cfg["concurrency_max"]   = int(cfg.get("concurrency_max", cfg["threads"] * 4))
     except (TypeError, ValueError) as e:
         raise ConfigError(f"Неверный формат параметров: {e}")
 
+    cfg["rate_limits"] = _load_rate_limits(cfg)
+
+    cfg.setdefault("alert_mode", "polling")
+    if cfg["alert_mode"] not in ("polling", "inline"):
+        raise ConfigError(f"Неизвестный alert_mode: {cfg['alert_mode']}")
+    if cfg["alert_mode"] == "inline" and not cfg.get("bot_token"):
+        raise ConfigError("Для alert_mode: inline нужен bot_token")
+    cfg.setdefault("chats_file", "chats.json")
+
+    cfg.setdefault("detail_backend", "html")
+    if cfg["detail_backend"] not in ("html", "graphql"):
+        raise ConfigError(f"Неизвестный detail_backend: {cfg['detail_backend']}")
+
     if cfg["enable_proxy"]:
         for k in ("proxy_username", "proxy_password", "proxy_host", "proxy_port"):
             if k not in cfg:
@@ -66,3 +124,33 @@ def load_config(profile: str, path: str = None) -> dict:
     cfg.setdefault("detail_user_agent", cfg["user_agents"][0])
 
     return cfg
+
+def _load_rate_limits(cfg: dict) -> dict:
+    """
+    rate_limits: {host: {rps, burst, jitter}}. Для getgems.io по умолчанию
+    темп, эквивалентный прежним паузам request_delay_min/max на threads задач;
+    для api.telegram.org — глобальный лимит Bot API.
+    """
+    mean_delay = (cfg["request_delay_min"] + cfg["request_delay_max"]) / 2
+    defaults = {
+        "getgems.io":       {"rps": cfg["threads"] / mean_delay if mean_delay > 0 else 0, "burst": cfg["threads"]},
+        "api.telegram.org": {"rps": 30, "burst": 30},
+    }
+    raw = {**defaults, **(cfg.get("rate_limits") or {})}
+    limits = {}
+    try:
+        for host, lim in raw.items():
+            if not lim:
+                continue
+            rps = float(lim.get("rps", 0))
+            if rps <= 0:
+                # rps: 0 — без ограничения для хоста
+                continue
+            limits[urlparse(f"//{host}").hostname] = {
+                "rps":    rps,
+                "burst":  max(1, int(lim.get("burst", 1))),
+                "jitter": float(lim.get("jitter", 0.0)),
+            }
+    except (TypeError, ValueError, AttributeError) as e:
+        raise ConfigError(f"Неверный формат rate_limits: {e}")
+    return limits
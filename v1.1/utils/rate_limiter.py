@@ -0,0 +1,49 @@
+# utils/rate_limiter.py
+
+import asyncio
+import random
+import time
+from urllib.parse import urlparse
+
+class TokenBucket:
+    """
+    Токен-бакет: rate запросов в секунду с запасом burst. Токены резервируются
+    сразу (баланс может уйти в минус), поэтому ожидающие выстраиваются в
+    очередь по времени вызова без блокировок.
+    """
+
+    def __init__(self, rate: float, burst: int = 1, jitter: float = 0.0):
+        self.rate = rate
+        self.burst = burst
+        self.jitter = jitter
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+
+    def _reserve(self) -> float:
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        self._tokens -= 1
+        return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    async def acquire(self):
+        delay = self._reserve()
+        if self.jitter:
+            # Джиттер — доля интервала между запросами
+            delay += random.uniform(0, self.jitter / self.rate)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+class RateLimiter:
+    """Набор токен-бакетов по хостам; запросы к прочим хостам не ограничиваются."""
+
+    def __init__(self, limits: dict):
+        self._buckets = {
+            host: TokenBucket(lim["rps"], lim["burst"], lim["jitter"])
+            for host, lim in limits.items()
+        }
+
+    async def acquire(self, url: str):
+        bucket = self._buckets.get(urlparse(url).hostname)
+        if bucket is not None:
+            await bucket.acquire()
@@ -16,6 +16,9 @@ class Statistics:
             self.total_errors = 0
             self.last_cycle_time = None
             self.last_stats_time = time.time()
+            self.concurrency_limit = None
+            # stage -> [count, total, max]
+            self.stage_times = {}
 
     def increment_cycle(self):
         with self.lock:
@@ -30,6 +33,17 @@ class Statistics:
         with self.lock:
             self.total_errors += 1
 
+    def set_concurrency_limit(self, limit: int):
+        with self.lock:
+            self.concurrency_limit = limit
+
+    def add_stage_time(self, stage: str, seconds: float):
+        with self.lock:
+            st = self.stage_times.setdefault(stage, [0, 0.0, 0.0])
+            st[0] += 1
+            st[1] += seconds
+            st[2] = max(st[2], seconds)
+
     def get_stats(self) -> Dict[str, Any]:
         with self.lock:
             current_time = time.time()
@@ -42,7 +56,9 @@ class Statistics:
                 "total_offers_processed": self.total_offers_processed,
                 "total_errors": self.total_errors,
                 "avg_cycle_time": uptime / self.cycles_completed if self.cycles_completed > 0 else 0,
-                "last_cycle_time": datetime.fromtimestamp(self.last_cycle_time).strftime("%Y-%m-%d %H:%M:%S") if self.last_cycle_time else "N/A"
+                "last_cycle_time": datetime.fromtimestamp(self.last_cycle_time).strftime("%Y-%m-%d %H:%M:%S") if self.last_cycle_time else "N/A",
+                "concurrency_limit": self.concurrency_limit,
+                "stages": {k: (c, t / c, m) for k, (c, t, m) in self.stage_times.items() if c},
             }
 
     def _format_time(self, seconds: float) -> str:
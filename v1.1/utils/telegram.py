@@ -0,0 +1,209 @@
+# utils/telegram.py
+
+import asyncio
+import json
+import os
+import time
+from pathlib import Path
+
+from utils.rate_limiter import TokenBucket
+
+class TelegramSender:
+    """
+    Рассылка sendMessage по многим чатам с ограниченной параллельностью.
+
+    Глобальный лимит Bot API (~30 сообщений/с) соблюдает общий RateLimiter
+    сессии по хосту api.telegram.org; здесь — токен-бакет на каждый чат
+    (chat_rps), пауза retry_after после 429 и ретраи 5xx/сетевых ошибок с
+    экспоненциальной задержкой. 429 у Bot API обычно означает превышение
+    общего лимита бота, поэтому retry_after приостанавливает все отправки
+    отправителя, а не только чат, получивший ответ. Чаты, ответившие 403 (бот заблокирован или
+    удалён из чата), возвращаются вызывающему для исключения из рассылки.
+    """
+
+    def __init__(self, session, bot_token: str, logger, concurrency: int = 20,
+                 chat_rps: float = 1.0, max_retries: int = 3):
+        self.session = session
+        self.logger = logger
+        self.chat_rps = chat_rps
+        self.max_retries = max_retries
+        self.url = f"https://api.telegram.org/bot{bot_token}/sendMessage"
+        self._sem = asyncio.Semaphore(max(1, concurrency))
+        self._chat_buckets = {}
+        # time.monotonic(), до которого отправки приостановлены после 429
+        self._paused_until = 0.0
+
+    def _bucket(self, chat_id) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self._chat_buckets[chat_id] = TokenBucket(self.chat_rps, 1)
+        return bucket
+
+    async def send(self, chat_id, text: str) -> str:
+        """
+        Одно сообщение в чат с ретраями.
+
+        Returns:
+            str: "ok", "blocked" (403) или "failed"
+        """
+        for attempt in range(self.max_retries + 1):
+            await self._bucket(chat_id).acquire()
+            delay = 2 ** attempt
+            async with self._sem:
+                pause = self._paused_until - time.monotonic()
+                if pause > 0:
+                    await asyncio.sleep(pause)
+                try:
+                    resp = await self.session.post(self.url, json={
+                        "chat_id": chat_id,
+                        "text": text,
+                        "disable_web_page_preview": True
+                    })
+                    try:
+                        status = resp.status
+                        data = await resp.json(content_type=None) if status != 200 else {}
+                    finally:
+                        resp.release()
+                except Exception as e:
+                    self.logger.warning("Send error to %s (attempt %d): %s", chat_id, attempt + 1, e)
+                    status, data = None, {}
+            if status == 200:
+                return "ok"
+            if status == 403:
+                self._chat_buckets.pop(chat_id, None)
+                self.logger.info("Chat %s blocked the bot: %s", chat_id, data.get("description"))
+                return "blocked"
+            if status == 429:
+                delay = (data.get("parameters") or {}).get("retry_after", delay)
+                self._paused_until = max(self._paused_until, time.monotonic() + delay)
+                self.logger.warning("Rate limited on chat %s, all sends paused for %ss", chat_id, delay)
+            elif status is not None and status < 500:
+                self.logger.error("Send error to %s: %s %s", chat_id, status, data.get("description"))
+                return "failed"
+            if attempt < self.max_retries:
+                await asyncio.sleep(delay)
+        return "failed"
+
+    async def send_all(self, chats, text: str) -> dict:
+        """Параллельная рассылка одного сообщения; см. send_many."""
+        return await self.send_many([(cid, text) for cid in chats])
+
+    async def send_many(self, messages: list) -> dict:
+        """
+        Параллельная отправка сообщений [(chat_id, text), ...].
+
+        Returns:
+            dict: results — "ok"/"blocked"/"failed" в порядке messages;
+            sent, failed — число сообщений; blocked — множество чатов с 403;
+            p50/p99 — задержка доставки от начала рассылки, с
+        """
+        start = time.perf_counter()
+        latencies = []
+
+        async def deliver(chat_id, text):
+            result = await self.send(chat_id, text)
+            if result == "ok":
+                latencies.append(time.perf_counter() - start)
+            return chat_id, result
+
+        results = await asyncio.gather(*(deliver(cid, text) for cid, text in messages))
+        blocked = {cid for cid, r in results if r == "blocked"}
+        failed = sum(1 for _, r in results if r == "failed")
+        latencies.sort()
+
+        def percentile(q):
+            return latencies[min(len(latencies) - 1, int(q * len(latencies)))] if latencies else 0.0
+
+        report = {
+            "results": [r for _, r in results],
+            "sent": len(latencies),
+            "failed": failed,
+            "blocked": blocked,
+            "p50": percentile(0.50),
+            "p99": percentile(0.99),
+        }
+        self.logger.info(
+            "Delivered %d/%d messages in %.2fs (p50 %.2fs, p99 %.2fs), %d blocked, %d failed",
+            report["sent"], len(results), time.perf_counter() - start,
+            report["p50"], report["p99"], len(blocked), failed,
+        )
+        return report
+
+class ChatRegistry:
+    """
+    Подписанные чаты и offset getUpdates в памяти. Файл (JSON) перезаписывается
+    атомарно (временный файл + os.replace) и только при изменениях. Старый
+    формат файла — просто список id чатов — читается как есть.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.chats = set()
+        self.offset = 0
+        if self.path.exists():
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+            if isinstance(data, list):
+                data = {"chats": data}
+            self.chats = set(data.get("chats", []))
+            self.offset = int(data.get("offset", 0))
+
+    def save(self):
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        tmp.write_text(json.dumps({"chats": sorted(self.chats), "offset": self.offset}), encoding="utf-8")
+        os.replace(tmp, self.path)
+
+    def apply_updates(self, updates: list) -> int:
+        """Добавляет чаты из обновлений и сдвигает offset. Returns: число новых чатов."""
+        if not updates:
+            return 0
+        before = len(self.chats)
+        for u in updates:
+            if "message" in u:
+                self.chats.add(u["message"]["chat"]["id"])
+            if "callback_query" in u:
+                self.chats.add(u["callback_query"]["from"]["id"])
+            self.offset = max(self.offset, u["update_id"] + 1)
+        self.save()
+        return len(self.chats) - before
+
+    def remove(self, chats: set):
+        if chats & self.chats:
+            self.chats -= chats
+            self.save()
+
+class UpdatePoller:
+    """
+    Фоновый long polling getUpdates. Переданный offset одновременно
+    подтверждает предыдущие обновления, отдельный запрос не нужен. timeout
+    должен быть меньше sock_read_timeout сессии.
+    """
+
+    def __init__(self, session, bot_token: str, registry: ChatRegistry, logger, timeout: int = 25):
+        self.session = session
+        self.registry = registry
+        self.logger = logger
+        self.timeout = timeout
+        self.url = f"https://api.telegram.org/bot{bot_token}/getUpdates"
+
+    async def run(self):
+        while True:
+            try:
+                resp = await self.session.get(
+                    f"{self.url}?timeout={self.timeout}&offset={self.registry.offset}"
+                )
+                data = await resp.json(content_type=None)
+                if resp.status != 200 or not isinstance(data, dict) or not data.get("ok"):
+                    # 409 (другой getUpdates), 401 и т.п. отвечают сразу: без паузы
+                    # цикл крутится и расходует общий лимит api.telegram.org
+                    description = data.get("description") if isinstance(data, dict) else data
+                    self.logger.warning("getUpdates failed: status %s, %s", resp.status, description)
+                    await asyncio.sleep(5)
+                    continue
+                added = self.registry.apply_updates(data.get("result") or [])
+                if added:
+                    self.logger.info("New chats: %d, known chats: %d", added, len(self.registry.chats))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.logger.warning("getUpdates error: %s", e)
+                await asyncio.sleep(5)